@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2018 SignalFx, Inc. All Rights Reserved.
+
+"""Benchmark suite for the SignalFlow CLI outputs.
+
+Each benchmark consumes the stream of a synthetic computation (see
+synthetic.py) through one of the CLI's outputs, at several scales, and
+measures its throughput and peak memory usage. Results are written as JSON
+lines, one per benchmark and scale, to stdout or appended to a file, so that
+they can be tracked over time:
+
+    $ python benchmarks/run.py --scales 10,1000,100000 --output results.jsonl
+"""
+
+from __future__ import print_function
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+import matplotlib  # noqa: E402
+matplotlib.use('Agg')
+
+import pytz  # noqa: E402
+
+from signalflowcli import buffered, csvflow, dimensions  # noqa: E402
+from signalflowcli import events, graph  # noqa: E402
+from signalflowcli import live, selection, sink, utils  # noqa: E402
+from signalflowcli.version import version  # noqa: E402
+import synthetic  # noqa: E402
+
+_PARAMS = dict(start=None, stop=None, resolution=None, max_delay=None)
+
+# Upper bound on the number of datapoints generated for each scale; the
+# number of messages is reduced for larger scales to stay within it.
+_MAX_DATAPOINTS = 1000000
+
+
+def bench_csvflow_stream(flow, devnull):
+    for _ in csvflow.stream(flow, 'synthetic', **_PARAMS):
+        pass
+
+
+def bench_csvflow_write(flow, devnull):
+    with sink.open_sink(os.devnull) as out:
+        csvflow.write(out, flow, 'synthetic', **_PARAMS)
+
+
+def bench_csvflow_write_buffered(flow, devnull):
+    with sink.open_sink(os.devnull) as out:
+        csvflow.write(out, buffered.BufferedFlow(flow), 'synthetic',
+                      **_PARAMS)
+
+
+def bench_events_write(flow, devnull):
+    with sink.open_sink(os.devnull) as out:
+        events.write(out, flow, 'synthetic', **_PARAMS)
+
+
+def bench_live(flow, devnull):
+    c = flow.execute('synthetic')
+    live.LiveOutputDisplay(c, pytz.utc, max_fps=None, out=devnull).stream()
+
+
+def bench_live_top(flow, devnull):
+    c = flow.execute('synthetic')
+    live.LiveOutputDisplay(c, pytz.utc, max_fps=None, out=devnull,
+                           selection=selection.parse('top 20')).stream()
+
+
+def bench_live_groupby(flow, devnull):
+    c = flow.execute('synthetic')
+    view = dimensions.View(grouping=dimensions.parse_grouping('az mean'))
+    live.LiveOutputDisplay(c, pytz.utc, max_fps=None, out=devnull,
+                           view=view).stream()
+
+
+def bench_graph(flow, devnull):
+    graph.render(csvflow.frame(flow, 'synthetic', **_PARAMS), pytz.utc)
+    import matplotlib.pyplot as plt
+    plt.close('all')
+
+
+def bench_timeseries_repr(flow, devnull):
+    for metadata in flow.metadata:
+        utils.timeseries_repr(metadata)
+
+
+BENCHMARKS = [
+    ('csvflow.stream', bench_csvflow_stream),
+    ('csvflow.write', bench_csvflow_write),
+    ('csvflow.write.buffered', bench_csvflow_write_buffered),
+    ('events.write', bench_events_write),
+    ('live', bench_live),
+    ('live.top', bench_live_top),
+    ('live.groupby', bench_live_groupby),
+    ('graph', bench_graph),
+    ('timeseries_repr', bench_timeseries_repr),
+]
+
+
+def measure(fn, flow, memory=True):
+    """Run the given benchmark function, returning its duration in seconds
+    and, if requested, its peak memory allocation in bytes (measured in a
+    second run, as tracing memory allocations slows execution down)."""
+    with open(os.devnull, 'w') as devnull, \
+            contextlib.redirect_stdout(devnull), \
+            contextlib.redirect_stderr(devnull):
+        started = time.time()
+        fn(flow, devnull)
+        duration = time.time() - started
+
+        peak = None
+        if memory:
+            tracemalloc.start()
+            fn(flow, devnull)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+    return duration, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--scales', default='10,100,1000,10000,100000',
+                        help='comma-separated numbers of time series '
+                             '(default: %(default)s)')
+    parser.add_argument('--messages', type=int, default=100,
+                        help='number of data messages per run, reduced at '
+                             'large scales (default: %(default)s)')
+    parser.add_argument('--sparsity', type=float, default=0.0,
+                        help='fraction of time series missing from each data '
+                             'message (default: %(default)s)')
+    parser.add_argument('--churn', type=float, default=0.0,
+                        help='fraction of time series replaced at each data '
+                             'message (default: %(default)s)')
+    parser.add_argument('--events', type=int, default=0,
+                        help='number of event messages (default: '
+                             '%(default)s)')
+    parser.add_argument('--benchmarks', default=None,
+                        help='comma-separated benchmarks to run (default: '
+                             'all of {0})'.format(
+                                 ', '.join(name for name, _ in BENCHMARKS)))
+    parser.add_argument('--graph-limit', type=int, default=1000,
+                        help='largest scale to run the graph benchmark at '
+                             '(default: %(default)s)')
+    parser.add_argument('--no-memory', action='store_true',
+                        help='skip peak memory measurements')
+    parser.add_argument('--output', default=None,
+                        help='append results to this file (default: '
+                             'stdout)')
+    options = parser.parse_args()
+
+    selected = options.benchmarks.split(',') if options.benchmarks else None
+    out = open(options.output, 'a') if options.output else sys.stdout
+    try:
+        for scale in [int(s) for s in options.scales.split(',')]:
+            count = max(2, min(options.messages, _MAX_DATAPOINTS // scale))
+            flow = synthetic.SyntheticFlow(scale, count,
+                                           sparsity=options.sparsity,
+                                           churn=options.churn,
+                                           events=options.events)
+            for name, fn in BENCHMARKS:
+                if selected and name not in selected:
+                    continue
+                if name == 'graph' and scale > options.graph_limit:
+                    continue
+
+                duration, peak = measure(fn, flow, not options.no_memory)
+                operations = len(flow.metadata) \
+                    if name == 'timeseries_repr' else count
+                result = {
+                    'benchmark': name,
+                    'series': scale,
+                    'messages': count,
+                    'sparsity': options.sparsity,
+                    'churn': options.churn,
+                    'events': options.events,
+                    'seconds': round(duration, 6),
+                    'per_second': round(operations / duration, 2)
+                    if duration else None,
+                    'peak_memory_bytes': peak,
+                    'version': version,
+                    'python': platform.python_version(),
+                    'timestamp': int(time.time()),
+                }
+                print(json.dumps(result, sort_keys=True), file=out)
+                out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2018 SignalFx, Inc. All Rights Reserved.
+
+"""Startup time guard for the SignalFlow CLI.
+
+Measures the time it takes a fresh interpreter to import the CLI's entry
+point, and checks that none of the heavy modules only needed by specific
+outputs or by the interactive prompt get imported along with it. Exits with
+a non-zero status if the median import time exceeds the given limit, or if
+any of those modules was imported, so that it can be used in CI:
+
+    $ python benchmarks/startup.py --runs 10 --max-seconds 0.25
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.insert(0, _ROOT)
+
+from signalflowcli.version import version  # noqa: E402
+
+# Modules that must not be imported by the CLI's entry point.
+_DEFERRED = [
+    'ansicolor',
+    'matplotlib',
+    'numpy',
+    'pandas',
+    'prompt_toolkit',
+    'pyarrow',
+    'pygments_signalflow',
+]
+
+_IMPORT = 'import signalflowcli.prompt'
+
+_CHECK = '''
+import json, sys
+{0}
+print(json.dumps(sorted(m for m in {1!r} if m in sys.modules)))
+'''.format(_IMPORT, _DEFERRED)
+
+
+def _run(code):
+    return subprocess.check_output([sys.executable, '-c', code], cwd=_ROOT)
+
+
+def measure(runs):
+    """Return the import time of the CLI's entry point in each of the given
+    number of fresh interpreters, in seconds, minus the startup time of the
+    interpreter itself."""
+    def _time(code):
+        started = time.time()
+        _run(code)
+        return time.time() - started
+
+    # Warm up the filesystem cache and compile the bytecode.
+    _run(_IMPORT)
+    baseline = sorted(_time('pass') for _ in range(runs))[runs // 2]
+    return [max(0.0, _time(_IMPORT) - baseline) for _ in range(runs)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--runs', type=int, default=10,
+                        help='number of measured runs (default: '
+                             '%(default)s)')
+    parser.add_argument('--max-seconds', type=float, default=None,
+                        help='fail if the median import time exceeds this '
+                             'many seconds')
+    options = parser.parse_args()
+
+    durations = sorted(measure(options.runs))
+    median = durations[len(durations) // 2]
+    imported = json.loads(_run(_CHECK).decode('utf-8'))
+    result = {
+        'benchmark': 'startup',
+        'runs': options.runs,
+        'min_seconds': round(durations[0], 6),
+        'median_seconds': round(median, 6),
+        'max_seconds': round(durations[-1], 6),
+        'deferred_imported': imported,
+        'version': version,
+        'python': platform.python_version(),
+        'timestamp': int(time.time()),
+    }
+    print(json.dumps(result, sort_keys=True))
+
+    failed = False
+    if imported:
+        sys.stderr.write('Modules imported at startup: {0}\n'
+                         .format(', '.join(imported)))
+        failed = True
+    if options.max_seconds is not None and median > options.max_seconds:
+        sys.stderr.write('Median import time {0:.3f}s exceeds {1:.3f}s\n'
+                         .format(median, options.max_seconds))
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2018 SignalFx, Inc. All Rights Reserved.
+
+"""A synthetic stand-in for a SignalFlow client connection.
+
+SyntheticFlow.execute() returns a computation that streams generated
+JobStart, Metadata, Data, Event and ExpiredTsId messages, with the same
+interface as the computations of the signalfx library."""
+
+import json
+import random
+from signalfx.signalflow import messages
+
+
+class _DataMessage(messages.DataMessage):
+    """A data message built directly from a {tsid: value} dictionary."""
+
+    def __init__(self, logical_timestamp_ms, data):
+        self._logical_timestamp_ms = logical_timestamp_ms
+        self._data = data
+
+
+def _metadata(i):
+    return {
+        'sf_type': 'MetricTimeSeries',
+        'sf_metric': 'synthetic.metric',
+        'sf_key': ['sf_metric', 'host', 'az'],
+        'host': 'host-{0:06d}'.format(i),
+        'az': 'az-{0}'.format(i % 4),
+        'sf_streamLabel': 'A',
+    }
+
+
+_EVENT_TSID = 'detector'
+_EVENT_METADATA = {
+    'sf_type': 'EventTimeSeries',
+    'sf_eventType': 'synthetic.detector',
+    'sf_key': ['sf_eventType'],
+    'sf_detectInputContexts': json.dumps({
+        '_S1': {'identifier': 'A'},
+    }),
+}
+
+
+def generate(tsids, count, sparsity=0.0, churn=0.0, events=0,
+             start=1500000000000, resolution=1000, seed=0):
+    """Generate the messages of a synthetic computation.
+
+    :param tsids: The number of time series reporting at any given time.
+    :param count: The number of data messages.
+    :param sparsity: The fraction of time series missing from each data
+        message.
+    :param churn: The fraction of the time series replaced by new ones
+        (with new metadata) at each data message.
+    :param events: The number of event messages, spread evenly across the
+        stream.
+    :param start: The timestamp of the first data message.
+    :param resolution: The interval between data messages, in milliseconds.
+    :param seed: The seed of the random generator.
+    """
+    rnd = random.Random(seed)
+    result = [messages.JobStartMessage(start, 'synthetic')]
+
+    first, last = 0, tsids
+    for i in range(first, last):
+        result.append(messages.MetadataMessage('tsid{0}'.format(i),
+                                               _metadata(i)))
+    if events:
+        result.append(messages.MetadataMessage(_EVENT_TSID,
+                                               _EVENT_METADATA))
+    event_interval = max(1, count // events) if events else 0
+
+    replaced = int(churn * tsids)
+    for n in range(count):
+        if n and replaced:
+            for i in range(first, first + replaced):
+                result.append(messages.ExpiredTsIdMessage(
+                    'tsid{0}'.format(i)))
+            for i in range(last, last + replaced):
+                result.append(messages.MetadataMessage('tsid{0}'.format(i),
+                                                       _metadata(i)))
+            first += replaced
+            last += replaced
+
+        ts = start + n * resolution
+        data = {}
+        for i in range(first, last):
+            if not sparsity or rnd.random() >= sparsity:
+                data['tsid{0}'.format(i)] = rnd.random() * 100
+        result.append(_DataMessage(ts, data))
+
+        if event_interval and n % event_interval == 0:
+            result.append(messages.EventMessage(
+                _EVENT_TSID, ts, {}, {
+                    'is': rnd.choice(['anomalous', 'ok']),
+                    'incidentId': 'incident{0}'.format(n),
+                    'inputs': json.dumps({
+                        '_S1': {'value': rnd.random() * 100,
+                                'key': {'host': 'host-000000'}},
+                    }),
+                }))
+    return result
+
+
+class SyntheticComputation(object):
+    """A computation streaming a pre-generated list of messages."""
+
+    def __init__(self, messages, resolution):
+        self._messages = messages
+        self._resolution = resolution
+        self._metadata = {}
+        self._last_logical_ts = None
+
+    @property
+    def resolution(self):
+        return self._resolution
+
+    @property
+    def last_logical_ts(self):
+        return self._last_logical_ts
+
+    def get_known_tsids(self):
+        return sorted(self._metadata.keys())
+
+    def get_metadata(self, tsid):
+        return self._metadata.get(tsid)
+
+    def close(self):
+        pass
+
+    def stream(self):
+        for message in self._messages:
+            if isinstance(message, messages.MetadataMessage):
+                self._metadata[message.tsid] = message.properties
+            elif isinstance(message, messages.ExpiredTsIdMessage):
+                self._metadata.pop(message.tsid, None)
+            elif isinstance(message, messages.DataMessage):
+                self._last_logical_ts = message.logical_timestamp_ms
+            yield message
+
+
+class SyntheticFlow(object):
+    """A stand-in for a SignalFlow client connection, whose computations
+    stream synthetic messages. Programs and computation parameters are
+    ignored; see generate() for the parameters."""
+
+    def __init__(self, tsids, count, sparsity=0.0, churn=0.0, events=0,
+                 resolution=1000, seed=0):
+        self._resolution = resolution
+        self._messages = generate(tsids, count, sparsity=sparsity,
+                                  churn=churn, events=events,
+                                  resolution=resolution, seed=seed)
+        # The metadata of all the time series of the computation.
+        self.metadata = [m.properties for m in self._messages
+                         if isinstance(m, messages.MetadataMessage)]
+
+    def execute(self, program, **kwargs):
+        return SyntheticComputation(self._messages, self._resolution)
+
+    def close(self):
+        pass
@@ -24,6 +24,10 @@ setup(
     zip_safe=True,
     packages=find_packages(),
     install_requires=requirements,
+    extras_require={
+        'parquet': ['pyarrow'],
+        'zstd': ['zstandard'],
+    },
     classifiers=[
         'Operating System :: OS Independent',
         'Programming Language :: Python',
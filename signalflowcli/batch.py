@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2018 SignalFx, Inc. All Rights Reserved.
+
+from concurrent import futures
+import os
+import sys
+import time
+
+from . import columnar, csvflow, dimensions, sink, utils
+
+
+_DEFAULT_PARALLELISM = 8
+
+_EXTENSIONS = {
+    'csv': '.csv',
+    'parquet': '.parquet',
+    'arrow': '.arrow',
+}
+
+FORMATS = sorted(_EXTENSIONS.keys())
+
+
+def _message(msg):
+    utils.message(msg, out=sys.stderr)
+
+
+def programs(path):
+    """Return the paths of the program files designated by the given path:
+    either all the files in a directory, or the files listed in a manifest
+    file, one per line, relative to the manifest's location. Blank lines and
+    lines starting with '#' in the manifest are ignored."""
+    if os.path.isdir(path):
+        return [os.path.join(path, name) for name in sorted(os.listdir(path))
+                if os.path.isfile(os.path.join(path, name))]
+
+    base = os.path.dirname(path)
+    with open(path) as f:
+        return [os.path.join(base, line.strip()) for line in f
+                if line.strip() and not line.startswith('#')]
+
+
+def _output_paths(paths, output_dir, output, compression=None):
+    """Return the output file path of each program, named after the program
+    file with the extension of the output format, followed by the extension
+    of the compression format for compressed csv outputs."""
+    ext = _EXTENSIONS[output]
+    if output == 'csv':
+        ext += sink.compression_extension(compression)
+    outputs = []
+    seen = set()
+    for path in paths:
+        name = os.path.splitext(os.path.basename(path))[0]
+        candidate, n = name, 1
+        while candidate in seen:
+            n += 1
+            candidate = '{0}-{1}'.format(name, n)
+        seen.add(candidate)
+        outputs.append(os.path.join(output_dir, candidate + ext))
+    return outputs
+
+
+def _metadata_path(output_path):
+    """Return the path of the time series metadata file accompanying the
+    given long layout CSV output."""
+    if sink.guess_compression(output_path):
+        output_path = os.path.splitext(output_path)[0]
+    return os.path.splitext(output_path)[0] + '.metadata.jsonl'
+
+
+def _execute(flow, path, output_path, output, params, row_group_size,
+             csv_layout, compression, compression_level, rotate_size,
+             rotate_interval, view):
+    """Execute the program from the given file and write its output to
+    output_path. Returns the execution time, in seconds."""
+    started = time.time()
+    with open(path) as f:
+        program = f.read()
+    if view:
+        # Views index the time series of a single computation.
+        view = dimensions.View(view.filter, view.grouping)
+    if output == 'csv':
+        out = sink.open_sink(output_path, flush_interval=None,
+                             compression=compression,
+                             compression_level=compression_level,
+                             rotate_size=rotate_size,
+                             rotate_interval=rotate_interval)
+        metadata = None
+        try:
+            if csv_layout == 'long':
+                metadata = sink.open_sink(_metadata_path(output_path),
+                                          flush_interval=None)
+            csvflow.write(out, flow, program, quiet=True, layout=csv_layout,
+                          metadata=metadata, view=view, **params)
+        finally:
+            out.close()
+            if metadata:
+                metadata.close()
+    else:
+        columnar.write(output_path, flow, program, quiet=True, fmt=output,
+                       row_group_size=row_group_size,
+                       compression=compression,
+                       compression_level=compression_level,
+                       rotate_size=rotate_size,
+                       rotate_interval=rotate_interval, view=view,
+                       **params)
+    return time.time() - started
+
+
+def run(flow, path, output_dir, output, params,
+        parallelism=_DEFAULT_PARALLELISM,
+        row_group_size=columnar._DEFAULT_ROW_GROUP_SIZE, csv_layout='wide',
+        compression=None, compression_level=None, rotate_size=None,
+        rotate_interval=None, view=None):
+    """Execute a batch of programs concurrently, over the given SignalFlow
+    client connection, writing the output of each program to its own file.
+
+    :param flow: An open SignalFlow client connection, shared by all
+        executions.
+    :param path: A directory of program files, or a manifest file listing
+        them (see programs()).
+    :param output_dir: The directory to write the output files to.
+    :param output: The output format, one of FORMATS.
+    :param params: The computation parameters, shared by all programs.
+    :param parallelism: The maximum number of programs executing at the same
+        time.
+    :param row_group_size: The number of rows per row group, for columnar
+        output formats.
+    :param csv_layout: The layout of csv outputs, one of csvflow.LAYOUTS.
+        The time series metadata of long layout outputs is written next to
+        them, in .metadata.jsonl files.
+    :param compression: The compression format of csv outputs (see
+        sink.open_sink()), or the compression codec of the columns of
+        columnar outputs (see columnar.write()).
+    :param compression_level: The compression level.
+    :param rotate_size: The size, in bytes, past which each output
+        continues in a new file, or None.
+    :param rotate_interval: The time, in seconds, after which each output
+        continues in a new file, or None.
+    :param view: A dimensions.View whose filter and grouping apply to each
+        output, or None.
+
+    Returns the number of programs that failed.
+    """
+    paths = programs(path)
+    outputs = _output_paths(paths, output_dir, output, compression)
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    _message('Executing {0} programs, {1} at a time...\n'
+             .format(len(paths), parallelism))
+    started = time.time()
+    durations = []
+    failures = 0
+
+    with futures.ThreadPoolExecutor(max_workers=parallelism) as executor:
+        jobs = dict((executor.submit(_execute, flow, p, o, output, params,
+                                     row_group_size, csv_layout, compression,
+                                     compression_level, rotate_size,
+                                     rotate_interval, view), (p, o))
+                    for p, o in zip(paths, outputs))
+        for job in futures.as_completed(jobs):
+            p, o = jobs[job]
+            try:
+                duration = job.result()
+                durations.append(duration)
+                _message('{0} -> {1} ({2:.2f}s)\n'.format(p, o, duration))
+            except Exception as e:
+                failures += 1
+                _message('{0} failed: {1}\n'.format(p, e))
+
+    elapsed = time.time() - started
+    _message('Completed {0} programs ({1} failed) in {2:.2f}s'
+             .format(len(paths), failures, elapsed))
+    if durations:
+        _message('; per program: min {0:.2f}s, avg {1:.2f}s, max {2:.2f}s, '
+                 'total {3:.2f}s'.format(min(durations),
+                                         sum(durations) / len(durations),
+                                         max(durations), sum(durations)))
+    _message('\n')
+    return failures
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2018 SignalFx, Inc. All Rights Reserved.
+
+"""Reading of computation streams ahead of their output, into a bounded
+queue, so that a slow output doesn't hold back the connection."""
+
+import collections
+from signalfx import signalflow
+import sys
+import threading
+
+from . import utils
+
+# Default maximum number of messages waiting to be consumed.
+_DEFAULT_SIZE = 1000
+
+# What to do with a data message received while the queue is full: wait
+# for the consumer to make room, drop the oldest queued data message, or
+# merge it into the last queued data message, keeping the latest value of
+# each time series.
+POLICIES = ['block', 'drop-oldest', 'coalesce']
+
+
+def _message(msg):
+    utils.message(msg, out=sys.stderr)
+
+
+class BufferedFlow(object):
+    """Wraps a SignalFlow client so that the stream of each computation is
+    read by its own thread into a bounded queue, that the output drains.
+
+    A slow output then doesn't stall reading from the connection, as long
+    as the queue has room. When it's full, data messages are handled
+    according to the policy, one of POLICIES; other messages always wait for
+    room, so that the metadata, events and control messages are never
+    lost."""
+
+    def __init__(self, flow, size=_DEFAULT_SIZE, policy='block'):
+        self._flow = flow
+        self._size = size
+        self._policy = policy
+
+    def execute(self, program, **kwargs):
+        return BufferedComputation(self._flow.execute(program, **kwargs),
+                                   self._size, self._policy)
+
+    def close(self):
+        self._flow.close()
+
+
+class BufferedComputation(object):
+    """A computation whose stream is read ahead by a background thread into
+    a bounded queue. See BufferedFlow.
+
+    The wrapped computation's metadata, known tsids and last logical
+    timestamp are those of the messages read ahead: by the time the
+    consumer gets a data message, the time series it carries may already
+    have expired. They are therefore tracked here instead, as the messages
+    are handed to the consumer."""
+
+    _END = object()
+
+    def __init__(self, computation, size, policy):
+        self._computation = computation
+        self._size = size
+        self._policy = policy
+        self._queue = collections.deque()
+        self._cv = threading.Condition()
+        self._closed = False
+        self._thread = None
+        # Whether the reader waits for room, or the consumer for messages;
+        # the other side only notifies them then.
+        self._reader_waiting = False
+        self._consumer_waiting = False
+        self._metadata = {}
+        self._last_logical_ts = None
+        self._resolution = None
+
+        self.max_depth = 0
+        self.dropped = 0
+        self.coalesced = 0
+
+    def __getattr__(self, name):
+        return getattr(self._computation, name)
+
+    @property
+    def resolution(self):
+        return self._resolution or self._computation.resolution
+
+    @property
+    def last_logical_ts(self):
+        return self._last_logical_ts
+
+    def get_known_tsids(self):
+        return sorted(self._metadata.keys())
+
+    def get_metadata(self, tsid):
+        return self._metadata.get(tsid)
+
+    def _consumed(self, message):
+        """Update the state of the computation as seen by the consumer with
+        the given message, about to be handed to it."""
+        if isinstance(message, signalflow.messages.MetadataMessage):
+            self._metadata[message.tsid] = message.properties
+        elif isinstance(message, signalflow.messages.ExpiredTsIdMessage):
+            self._metadata.pop(message.tsid, None)
+        elif isinstance(message, signalflow.messages.DataMessage):
+            self._last_logical_ts = message.logical_timestamp_ms
+        elif isinstance(message, signalflow.messages.InfoMessage):
+            # The resolution is only known once announced by an info
+            # message, and doesn't change afterwards.
+            self._resolution = self._computation.resolution
+
+    def _drop_oldest(self):
+        """Drop the oldest queued data message, if any. Returns whether a
+        message was dropped."""
+        for i, message in enumerate(self._queue):
+            if isinstance(message, signalflow.messages.DataMessage):
+                del self._queue[i]
+                self.dropped += 1
+                return True
+        return False
+
+    def _coalesce(self, message):
+        """Merge the given data message into the last queued message, if it
+        is a data message. Returns whether the message was merged."""
+        last = self._queue[-1] if self._queue else None
+        if not isinstance(last, signalflow.messages.DataMessage):
+            return False
+        merged = signalflow.messages.DataMessage(
+            message.logical_timestamp_ms, [])
+        merged.add_data(last.data)
+        merged.add_data(message.data)
+        self._queue[-1] = merged
+        self.coalesced += 1
+        return True
+
+    def _put(self, message):
+        with self._cv:
+            while len(self._queue) >= self._size and not self._closed:
+                if isinstance(message, signalflow.messages.DataMessage):
+                    if self._policy == 'drop-oldest' and self._drop_oldest():
+                        break
+                    if self._policy == 'coalesce' and \
+                            self._coalesce(message):
+                        return
+                self._reader_waiting = True
+                self._cv.wait()
+                self._reader_waiting = False
+            if self._closed:
+                return
+            self._queue.append(message)
+            self.max_depth = max(self.max_depth, len(self._queue))
+            if self._consumer_waiting:
+                self._cv.notify()
+
+    def _read(self):
+        try:
+            for message in self._computation.stream():
+                if self._closed:
+                    return
+                self._put(message)
+        except Exception as e:
+            self._put(e)
+        finally:
+            self._put(BufferedComputation._END)
+
+    def stream(self):
+        if not self._thread:
+            self._thread = threading.Thread(target=self._read)
+            self._thread.daemon = True
+            self._thread.start()
+
+        while True:
+            with self._cv:
+                while not self._queue:
+                    if self._closed:
+                        return
+                    # Wait in steps, to stay interruptible.
+                    self._consumer_waiting = True
+                    self._cv.wait(1)
+                    self._consumer_waiting = False
+                message = self._queue.popleft()
+                if self._reader_waiting:
+                    self._cv.notify()
+            if message is BufferedComputation._END:
+                return
+            if isinstance(message, Exception):
+                raise message
+            self._consumed(message)
+            yield message
+
+    def queue_report(self):
+        """Return the queue's statistics as a dictionary: its size and
+        policy, its current and maximum depth, and the number of data
+        messages dropped or coalesced because it was full."""
+        return {
+            'size': self._size,
+            'policy': self._policy,
+            'depth': len(self._queue),
+            'max_depth': self.max_depth,
+            'dropped': self.dropped,
+            'coalesced': self.coalesced,
+        }
+
+    def close(self):
+        with self._cv:
+            self._closed = True
+            self._cv.notify_all()
+        try:
+            self._computation.close()
+        finally:
+            if self.dropped or self.coalesced:
+                _message('Output too slow: {0} data messages dropped, {1} '
+                         'coalesced.\n'.format(self.dropped, self.coalesced))
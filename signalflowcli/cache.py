@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2018 SignalFx, Inc. All Rights Reserved.
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+from . import recording
+
+_DEFAULT_DIRECTORY = os.path.join(
+    os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')),
+    'signalflow-cli')
+
+# Default maximum total size of the cache, in bytes.
+_DEFAULT_MAX_SIZE = 1 << 30
+
+# Default maximum age of cached results, in seconds.
+_DEFAULT_MAX_AGE = 7 * 24 * 3600
+
+_SUFFIX = '.sfr'
+
+
+class ResultCache(object):
+    """An on-disk cache of computation results.
+
+    Each result is stored as a recording of the computation's message
+    stream, in a file named after the key of the computation. Results older
+    than max_age are evicted, and the least recently used results are
+    evicted when the total size of the cache exceeds max_size. A result's
+    modification time is the time it was stored, and its access time the
+    last time it was used."""
+
+    def __init__(self, directory=_DEFAULT_DIRECTORY,
+                 max_size=_DEFAULT_MAX_SIZE, max_age=_DEFAULT_MAX_AGE):
+        self._directory = directory
+        self._max_size = max_size
+        self._max_age = max_age
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    @staticmethod
+    def key(program, **params):
+        """Return the cache key of the given program and computation
+        parameters."""
+        data = json.dumps([program, params], sort_keys=True)
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self._directory, key + _SUFFIX)
+
+    def get(self, key):
+        """Return the path of the recording of the cached result with the
+        given key, or None if it isn't cached."""
+        path = self._path(key)
+        try:
+            now = time.time()
+            mtime = os.path.getmtime(path)
+            if now - mtime > self._max_age:
+                return None
+            os.utime(path, (now, mtime))
+            return path
+        except OSError:
+            return None
+
+    def put(self, key, computation):
+        """Wrap the given computation to record its result into the cache
+        once its stream completes."""
+        fd, tmp = tempfile.mkstemp(dir=self._directory, suffix='.tmp')
+        os.close(fd)
+
+        def on_close(path, complete):
+            try:
+                if complete:
+                    os.rename(path, self._path(key))
+                    self.evict()
+                else:
+                    os.remove(path)
+            except OSError:
+                pass
+
+        return recording.RecordingComputation(computation, tmp, on_close)
+
+    def evict(self):
+        """Remove expired results, then least recently used results until
+        the cache fits within its maximum size."""
+        now = time.time()
+        entries = []
+        for name in os.listdir(self._directory):
+            if not name.endswith(_SUFFIX):
+                continue
+            path = os.path.join(self._directory, name)
+            try:
+                st = os.stat(path)
+                if now - st.st_mtime > self._max_age:
+                    os.remove(path)
+                else:
+                    entries.append((st.st_atime, st.st_size, path))
+            except OSError:
+                pass
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self._max_size:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+
+class CachingFlow(object):
+    """Wraps a SignalFlow client to serve computations over a time range
+    entirely in the past from a ResultCache.
+
+    The result of such computations is deterministic. On a cache hit, the
+    result is replayed from the cache without contacting the backend; on a
+    miss, the computation is executed and its result stored in the cache
+    once complete."""
+
+    def __init__(self, flow, cache):
+        self._flow = flow
+        self._cache = cache
+
+    def execute(self, program, start=None, stop=None, resolution=None,
+                max_delay=None, immediate=False, **kwargs):
+        if not start or not stop or stop > time.time() * 1000:
+            return self._flow.execute(program, start=start, stop=stop,
+                                      resolution=resolution,
+                                      max_delay=max_delay,
+                                      immediate=immediate, **kwargs)
+
+        key = ResultCache.key(program, start=start, stop=stop,
+                              resolution=resolution, max_delay=max_delay,
+                              immediate=immediate)
+        path = self._cache.get(key)
+        if path:
+            return recording.ReplayComputation(path)
+
+        c = self._flow.execute(program, start=start, stop=stop,
+                               resolution=resolution, max_delay=max_delay,
+                               immediate=immediate, **kwargs)
+        return self._cache.put(key, c)
+
+    def close(self):
+        self._flow.close()
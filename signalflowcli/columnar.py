@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2018 SignalFx, Inc. All Rights Reserved.
+
+import os
+import sys
+import time
+
+from . import csvflow, sink, utils
+
+
+# Number of rows buffered before being written out as a row group (parquet)
+# or record batch (arrow).
+_DEFAULT_ROW_GROUP_SIZE = 10000
+
+FORMATS = ['parquet', 'arrow']
+
+
+def _message(msg):
+    utils.message(msg, out=sys.stderr)
+
+
+class _Writer(object):
+    """Writes blocks of rows as typed columnar row groups, to a parquet file
+    or to an Arrow IPC file."""
+
+    def __init__(self, pa, fmt, path, schema, compression=None,
+                 compression_level=None):
+        self._pa = pa
+        self._path = path
+        self.opened = time.time()
+
+        # Column names must be unique.
+        seen = set()
+        fields = [pa.field('timestamp', pa.timestamp('ms', tz='UTC'))]
+        for tsid, name in zip(schema.tsids, schema.names):
+            fields.append(pa.field(csvflow.unique_name(tsid, name, seen),
+                                   pa.float64(), metadata={'tsid': tsid}))
+        self._schema = pa.schema(fields)
+
+        if fmt == 'parquet':
+            import pyarrow.parquet
+            self._writer = pyarrow.parquet.ParquetWriter(
+                path, self._schema, compression=compression or 'snappy',
+                compression_level=compression_level)
+            self._write = self._writer.write_table
+        else:
+            # Arrow IPC files only support zstd (or lz4) compression.
+            codec = pa.Codec(compression or 'zstd',
+                             compression_level=compression_level)
+            self._writer = pa.ipc.new_file(
+                path, self._schema,
+                options=pa.ipc.IpcWriteOptions(compression=codec))
+            self._write = self._writer.write
+
+    @property
+    def columns(self):
+        return len(self._schema) - 1
+
+    @property
+    def size(self):
+        """The size of the file written so far, in bytes."""
+        return os.path.getsize(self._path)
+
+    def write(self, block):
+        """Write the given block of rows."""
+        if not len(block):
+            return
+        import numpy
+        pa = self._pa
+        values = block.values(self.columns)
+        arrays = [pa.array(block.timestamps(), type=self._schema[0].type)]
+        for i in range(self.columns):
+            column = numpy.ascontiguousarray(values[:, i])
+            arrays.append(pa.array(column, mask=numpy.isnan(column)))
+        self._write(pa.Table.from_arrays(arrays, schema=self._schema))
+
+    def close(self):
+        self._writer.close()
+
+
+def write(path, flow, program, start, stop, resolution, max_delay,
+          immediate=False, quiet=False, fmt='parquet',
+          row_group_size=_DEFAULT_ROW_GROUP_SIZE, stats=None,
+          compression=None, compression_level=None, rotate_size=None,
+          rotate_interval=None, view=None):
+    """Execute a SignalFlow computation and write the results to a columnar
+    file, with a timestamp column followed by one float64 column per time
+    series, missing values being nulls.
+
+    Rows are buffered and written out in row groups of row_group_size rows,
+    keeping memory usage flat regardless of the length of the computation.
+    Each row group is written with the columns of all the time series known
+    when it's full, time series appearing while it's buffered being null
+    for the rows before they appeared. Since the schema of a columnar file
+    is fixed once its first row group is written, a row group with columns
+    the current file doesn't have continues the output in a new part file,
+    named after the given path with a part number inserted before its
+    extension. The output is also rotated to a new part file once the
+    current one grows over rotate_size bytes, or after rotate_interval
+    seconds; this is checked before each row group is written.
+
+    :param path: The path of the file to write to.
+    :param fmt: The output format, 'parquet' or 'arrow'.
+    :param row_group_size: The number of rows per row group.
+    :param compression: The compression codec of the columns, or None for
+        the format's default (snappy for parquet, zstd for arrow).
+    :param compression_level: The compression level, or None for the
+        codec's default.
+    :param rotate_size: The size, in bytes, past which output continues in
+        a new part file, or None.
+    :param rotate_interval: The time, in seconds, after which output
+        continues in a new part file, or None.
+
+    See csvflow.rows() for a description of the other parameters.
+    """
+    try:
+        import pyarrow
+    except ImportError:
+        if quiet:
+            raise
+        _message('The pyarrow package is required for {0} output.\n'
+                 .format(fmt))
+        return
+
+    def _rotate(writer, schema):
+        if writer.columns != len(schema):
+            return True
+        if rotate_interval and \
+                time.time() - writer.opened >= rotate_interval:
+            return True
+        return rotate_size and writer.size >= rotate_size
+
+    def _write(writer, part, schema, block):
+        """Write the given block as a row group, in a new part file if
+        needed. Returns the writer and the part number it writes to."""
+        if writer and _rotate(writer, schema):
+            writer.close()
+            writer = None
+            part += 1
+            if not quiet:
+                _message('Continuing in {0}\n'
+                         .format(sink.part_path(path, part)))
+        if not writer:
+            writer = _Writer(pyarrow, fmt, sink.part_path(path, part),
+                             schema, compression, compression_level)
+        writer.write(block)
+        return writer, part
+
+    writer = None
+    part = 0
+    schema = None
+    block = csvflow.Block()
+    try:
+        for schema, message in csvflow.table(flow, program, start, stop,
+                                             resolution, max_delay,
+                                             immediate, quiet, stats,
+                                             view):
+            block.append(schema, message)
+            if len(block) >= row_group_size:
+                writer, part = _write(writer, part, schema, block)
+                block = csvflow.Block()
+    finally:
+        try:
+            if len(block):
+                writer, part = _write(writer, part, schema, block)
+        finally:
+            if writer:
+                writer.close()
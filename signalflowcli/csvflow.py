@@ -3,41 +3,295 @@
 
 # Copyright (C) 2016-2018 SignalFx, Inc. All Rights Reserved.
 
+import array
 import csv
+import heapq
+import json
 from signalfx import signalflow
 import six
 import sys
 
 from . import utils
 
+# Layouts of the CSV output: one column per time series, or one row per
+# value.
+LAYOUTS = ['wide', 'long']
 
-def stream(flow, program, start, stop, resolution, max_delay, immediate=False):
-    """Execute a SignalFlow computation and output the results as CSV.
+_LONG_HEADER = ['timestamp', 'timeseries', 'value']
 
-    :param flow: An open SignalFlow client connection.
-    :param program: The program to execute.
-    :param start: The absolute start timestamp, in milliseconds since Epoch.
-    :param stop: An optional stop timestamp, in milliseconds since Epoch, or
-        None for infinite streaming.
-    :param resolution: The desired compute resolution, in milliseconds.
-    :param max_delay: The desired maximum data wait, in milliseconds, or None
-        for automatic.
-    :param immediate: Whether to offset by max_delay and return immediate
-        results (not always desirable).
-    """
 
-    buf = six.StringIO()
-    writer = csv.writer(buf, dialect=csv.excel, quoting=csv.QUOTE_NONNUMERIC)
+def unique_name(tsid, name, seen):
+    """Return a name for the given time series that isn't one of the given
+    set of names already in use, and add it to the set. This is its
+    representation, qualified with its tsid if it collides with another name
+    (or 'timestamp'), or its tsid if it has no representation."""
+    name = name or tsid
+    if name in seen or name == 'timestamp':
+        name = u'{0} ({1})'.format(name, tsid)
+    seen.add(name)
+    return name
 
-    def _message(msg):
-        utils.message(msg, out=sys.stderr)
 
-    def _emit(row):
-        writer.writerow(row)
-        line = buf.getvalue().strip()
-        buf.truncate(0)
-        buf.seek(0)
-        return line
+class Schema(object):
+    """The column layout of the tabular output of a computation.
+
+    Columns are assigned to MetricTimeSeries as their metadata becomes known,
+    and keep their position for the lifetime of the stream. New time series
+    appearing mid-stream are appended as new columns at the end of the
+    table. The tsid to column index mapping makes building a row only cost
+    as much as the number of values carried by each data message.
+
+    With a dimensions.View, only the time series it lets through get a
+    column; when it groups time series, each column holds the aggregated
+    values of the time series of a group, and is identified by the group's
+    label in place of a tsid.
+
+    The columns of expired time series can be freed (see remove()), to be
+    reused by the time series added next, which keeps the number of columns
+    bounded by the number of live time series when they churn.
+
+    Columns are named after the representations of their time series, from
+    the given utils.TimeseriesReprCache of the computation, if any."""
+
+    def __init__(self, computation, view=None, reprs=None):
+        self._computation = computation
+        self._view = view
+        self._index = {}
+        self._columns = {}
+        # Heap of the indices of the freed columns.
+        self._free = []
+        self._reprs = reprs if reprs is not None else \
+            utils.TimeseriesReprCache()
+        self.tsids = []
+        self.names = []
+
+    def __len__(self):
+        return len(self.tsids)
+
+    def add(self, tsid):
+        """Add a column for the given timeseries, if it's a MetricTimeSeries
+        that isn't already part of the schema. Returns True if a new column
+        was added."""
+        if tsid in self._index:
+            return False
+        metadata = self._computation.get_metadata(tsid)
+        if not metadata or metadata.get('sf_type') != 'MetricTimeSeries':
+            return False
+        key = tsid
+        if self._view:
+            key = self._view.key(tsid, metadata)
+            if key is None:
+                return False
+        if key in self._columns:
+            self._index[tsid] = self._columns[key]
+            return False
+        name = key if self._view and self._view.grouping else \
+            self._reprs.get(tsid, metadata)
+        if self._free:
+            i = heapq.heappop(self._free)
+            self.tsids[i], self.names[i] = key, name
+        else:
+            i = len(self.tsids)
+            self.tsids.append(key)
+            self.names.append(name)
+        self._index[tsid] = self._columns[key] = i
+        return True
+
+    def remove(self, tsid):
+        """Free the column of the given expired time series, to be reused
+        by the next time series added. Its key and name become None until
+        then. The columns of groups of time series are kept. Returns True if
+        a column was freed."""
+        i = self._index.pop(tsid, None)
+        if i is None or (self._view and self._view.grouping):
+            return False
+        del self._columns[self.tsids[i]]
+        self.tsids[i] = self.names[i] = None
+        heapq.heappush(self._free, i)
+        return True
+
+    def restore(self, columns):
+        """Restore the columns of a previous output of the computation,
+        given as (key, name) pairs, so that its time series are assigned the
+        same columns again."""
+        for key, name in columns:
+            self._columns[key] = len(self.tsids)
+            self.tsids.append(key)
+            self.names.append(name)
+
+    def metadata(self, i):
+        """Return the metadata of the time series of the ith column."""
+        return self._computation.get_metadata(self.tsids[i])
+
+    def header(self):
+        """Return the header row for this schema."""
+        return ['timestamp'] + self.names
+
+    def values(self, message):
+        """Generate the (column index, value) pairs of the given data
+        message, for the time series that are part of the schema."""
+        if self._view and self._view.grouping:
+            groups = {}
+            for tsid, value in six.iteritems(message.data):
+                i = self._index.get(tsid)
+                if i is not None and value is not None:
+                    groups.setdefault(i, []).append(value)
+            for i, values in six.iteritems(groups):
+                yield i, self._view.aggregate(values)
+            return
+
+        for tsid, value in six.iteritems(message.data):
+            i = self._index.get(tsid)
+            if i is not None:
+                yield i, value
+
+    def row(self, message, missing=''):
+        """Return the output row for the given data message."""
+        row = [missing] * (len(self.tsids) + 1)
+        row[0] = message.logical_timestamp_ms
+        for i, value in self.values(message):
+            row[i + 1] = value
+        return row
+
+
+class Block(object):
+    """The values of a sequence of data messages, accumulated in flat typed
+    arrays of (row, column, value) triplets as they arrive, and only turned
+    into a dense table when needed."""
+
+    def __init__(self):
+        self._timestamps = array.array('d')
+        self._rowids = array.array('l')
+        self._colids = array.array('l')
+        self._values = array.array('d')
+
+    def __len__(self):
+        return len(self._timestamps)
+
+    def append(self, schema, message):
+        """Append the values of the given data message, placed according to
+        the given schema, as a new row."""
+        row = len(self._timestamps)
+        self._timestamps.append(message.logical_timestamp_ms)
+        for i, value in schema.values(message):
+            if value is not None:
+                self._rowids.append(row)
+                self._colids.append(i)
+                self._values.append(value)
+
+    def timestamps(self):
+        """Return the timestamps of the rows, as a NumPy array of
+        milliseconds since Epoch."""
+        import numpy
+        return numpy.asarray(self._timestamps, dtype='int64')
+
+    def values(self, columns):
+        """Return the values as a dense, NaN-filled, 2D NumPy array of the
+        given number of columns."""
+        import numpy
+        data = numpy.full((len(self._timestamps), columns), numpy.nan)
+        data[numpy.asarray(self._rowids), numpy.asarray(self._colids)] = \
+            numpy.asarray(self._values)
+        return data
+
+
+class Window(object):
+    """A sliding window over the most recent rows of values of a sequence
+    of data messages, kept in dense, NaN-filled NumPy arrays.
+
+    The arrays are preallocated, and grow as rows and columns are added, up
+    to twice the size of the window. Once full, the rows of the window are
+    moved back to the start of the arrays, so that memory usage stays
+    bounded while appending a row costs constant amortized time.
+
+    When the schema reuses the column of an expired time series for a new
+    one (see Schema.remove()), the values of the expired time series still
+    in the window are dropped from that column."""
+
+    def __init__(self, size, capacity=64, columns=8):
+        import numpy
+        self._size = size
+        self._start = 0
+        self._rows = 0
+        capacity = min(capacity, 2 * size)
+        self._timestamps = numpy.zeros(capacity, dtype='int64')
+        self._values = numpy.full((capacity, columns), numpy.nan)
+        # Key of the time series whose values each column holds.
+        self._keys = [None] * columns
+
+    def __len__(self):
+        return self._rows
+
+    def _make_room(self, columns):
+        import numpy
+        capacity, width = self._values.shape
+        if self._start + self._rows == capacity:
+            if capacity < 2 * self._size:
+                capacity = min(2 * capacity, 2 * self._size)
+            else:
+                end = self._start + self._rows
+                self._timestamps[:self._rows] = \
+                    self._timestamps[self._start:end]
+                self._values[:self._rows] = self._values[self._start:end]
+                self._start = 0
+        while width < columns:
+            width *= 2
+        if (capacity, width) != self._values.shape:
+            timestamps = numpy.zeros(capacity, dtype='int64')
+            timestamps[:len(self._timestamps)] = self._timestamps
+            values = numpy.full((capacity, width), numpy.nan)
+            values[:len(self._values), :self._values.shape[1]] = \
+                self._values
+            self._timestamps, self._values = timestamps, values
+            self._keys.extend([None] * (width - len(self._keys)))
+
+    def append(self, schema, message):
+        """Append the values of the given data message, placed according to
+        the given schema, as a new row, dropping the oldest row if the
+        window is full."""
+        self._make_room(len(schema))
+        end = self._start + self._rows
+        self._timestamps[end] = message.logical_timestamp_ms
+        row = self._values[end]
+        row[:] = float('nan')
+        for i, value in schema.values(message):
+            if self._keys[i] != schema.tsids[i]:
+                self._values[:, i] = float('nan')
+                self._keys[i] = schema.tsids[i]
+            if value is not None:
+                row[i] = value
+        if self._rows == self._size:
+            self._start += 1
+        else:
+            self._rows += 1
+
+    def timestamps(self):
+        """Return the timestamps of the rows in the window, in milliseconds
+        since Epoch."""
+        return self._timestamps[self._start:self._start + self._rows]
+
+    def values(self, columns):
+        """Return the values of the rows in the window, as a 2D array of the
+        given number of columns."""
+        return self._values[self._start:self._start + self._rows, :columns]
+
+
+def table(flow, program, start, stop, resolution, max_delay,
+          immediate=False, quiet=False, stats=None, view=None,
+          checkpoint=None, expire=False):
+    """Execute a SignalFlow computation and generate a (schema, message)
+    pair for each data message it outputs. The schema is the same object
+    throughout, updated as new time series appear, and, with expire, as
+    time series expire, their columns being reused by the next new ones
+    (see Schema.remove()). See rows() for a description of the other
+    parameters.
+
+    With a checkpoint, each message is recorded as output once the consumer
+    asks for the next one, and the checkpoint is saved when the stream
+    ends."""
+    def _message(msg):
+        if not quiet:
+            utils.message(msg, out=sys.stderr)
 
     try:
         _message('Requesting computation...')
@@ -45,13 +299,21 @@ def stream(flow, program, start, stop, resolution, max_delay, immediate=False):
                          resolution=resolution, max_delay=max_delay,
                          immediate=immediate, persistent=False)
     except Exception as e:
+        if quiet:
+            raise
         _message('\r\033[K')
         _message(e)
         return
 
-    header = None
+    schema = None
+    # Representations of the computation's live time series.
+    reprs = utils.TimeseriesReprCache()
+    complete = False
     try:
-        for message in c.stream():
+        messages = c.stream()
+        if stats:
+            messages = stats.track(messages, c)
+        for message in messages:
             if isinstance(message, signalflow.messages.JobStartMessage):
                 _message(' started; waiting for data...')
                 continue
@@ -60,27 +322,251 @@ def stream(flow, program, start, stop, resolution, max_delay, immediate=False):
                 _message(' {0}%'.format(message.progress))
                 continue
 
+            # Time series showing up after the schema was built are
+            # appended as new columns.
+            if isinstance(message, signalflow.messages.MetadataMessage):
+                if schema:
+                    schema.add(message.tsid)
+                continue
+
+            if isinstance(message, signalflow.messages.ExpiredTsIdMessage):
+                reprs.expire(message.tsid)
+                if schema and expire:
+                    schema.remove(message.tsid)
+                if view:
+                    view.remove(message.tsid)
+                continue
+
             if not isinstance(message, signalflow.messages.DataMessage):
                 continue
 
             # At this point, metadata will be available
-            if not header:
-                header = ['timestamp']
-                header.extend([utils.timeseries_repr(c.get_metadata(tsid))
-                               for tsid in c.get_known_tsids()
-                               if c.get_metadata(tsid)['sf_type'] ==
-                               'MetricTimeSeries'])
+            if not schema:
+                schema = Schema(c, view, reprs)
+                if checkpoint and checkpoint.columns:
+                    schema.restore(checkpoint.columns)
+                for tsid in c.get_known_tsids():
+                    schema.add(tsid)
                 _message('\n')
-                yield _emit(header)
-
-            # Note: this assumes that membership of the job doesn't
-            # change during the stream.
-            row = [message.logical_timestamp_ms]
-            for tsid in c.get_known_tsids():
-                if c.get_metadata(tsid)['sf_type'] == 'MetricTimeSeries':
-                    row.append(message.data.get(tsid, ''))
-            yield _emit(row)
+
+            yield schema, message
+            if checkpoint:
+                checkpoint.update(schema, message.logical_timestamp_ms,
+                                  c.resolution)
+        complete = True
     except KeyboardInterrupt:
         pass
     finally:
         c.close()
+        if checkpoint:
+            checkpoint.save(complete)
+
+
+def rows(flow, program, start, stop, resolution, max_delay, immediate=False,
+         quiet=False, stats=None, view=None):
+    """Execute a SignalFlow computation and generate the rows of its tabular
+    output: a header row first, followed by one row of values per logical
+    timestamp.
+
+    :param flow: An open SignalFlow client connection.
+    :param program: The program to execute.
+    :param start: The absolute start timestamp, in milliseconds since Epoch.
+    :param stop: An optional stop timestamp, in milliseconds since Epoch, or
+        None for infinite streaming.
+    :param resolution: The desired compute resolution, in milliseconds.
+    :param max_delay: The desired maximum data wait, in milliseconds, or None
+        for automatic.
+    :param immediate: Whether to offset by max_delay and return immediate
+        results (not always desirable).
+    :param quiet: Whether to omit progress messages. Errors are then raised
+        to the caller instead of being displayed.
+    :param stats: An optional stats.StreamStats, created right before the
+        call, to collect statistics about the computation's message stream.
+    :param view: An optional dimensions.View filtering and grouping the
+        time series of the output by their dimensions.
+
+    Time series appearing mid-stream get new columns, appended at the end
+    of the following rows and announced on stderr. A new header row, naming
+    all the columns, is generated before the first row with new columns, so
+    that each row is described by the last header row before it. The output
+    is therefore only a plain table when the time series of the computation
+    don't change mid-stream; the long layout (see long_rows()) suits
+    computations whose time series come and go.
+    """
+    columns = None
+    for schema, row in _wide_rows(flow, program, start, stop, resolution,
+                                  max_delay, immediate, quiet, stats, view):
+        if len(schema) != columns:
+            columns = len(schema)
+            yield schema.header()
+        yield row
+
+
+def _wide_rows(flow, program, start, stop, resolution, max_delay, immediate,
+               quiet, stats, view, checkpoint=None):
+    """Generate a (schema, row) pair for each data message of a SignalFlow
+    computation, announcing the columns added to the schema since the
+    previous row, as time series appear. See rows()."""
+    columns = None
+    for schema, message in table(flow, program, start, stop, resolution,
+                                 max_delay, immediate, quiet, stats, view,
+                                 checkpoint):
+        if columns is not None and not quiet:
+            for i in range(columns, len(schema)):
+                utils.message('Schema change: added column {0} ({1})\n'
+                              .format(i + 1, schema.names[i]),
+                              out=sys.stderr)
+        columns = len(schema)
+        yield schema, schema.row(message)
+
+
+def long_rows(flow, program, start, stop, resolution, max_delay,
+              immediate=False, quiet=False, stats=None, metadata=None,
+              view=None):
+    """Execute a SignalFlow computation and generate the rows of its output
+    in long format: a header row first, followed by one (timestamp, time
+    series, value) row per value present in the output. Missing values
+    take no space, so the output grows with the number of values rather
+    than with the number of timestamps times the number of time series.
+
+    Time series are named after their representation, qualified with their
+    tsid when several time series share the same representation.
+
+    :param metadata: An optional file-like object to write the metadata of
+        each time series to, once, when it first appears, as a line of JSON
+        holding its name, tsid and metadata.
+
+    See rows() for a description of the other parameters.
+    """
+    header = False
+    for row in _long_rows(flow, program, start, stop, resolution, max_delay,
+                          immediate, quiet, stats, metadata, view):
+        if not header:
+            header = True
+            yield _LONG_HEADER
+        yield row
+
+
+def _long_rows(flow, program, start, stop, resolution, max_delay, immediate,
+               quiet, stats, metadata, view, checkpoint=None):
+    """Generate the rows of the output of a SignalFlow computation in long
+    format, without a header row. See long_rows()."""
+    names = []
+    seen = set()
+    for schema, message in table(flow, program, start, stop, resolution,
+                                 max_delay, immediate, quiet, stats, view,
+                                 checkpoint):
+        while len(names) < len(schema):
+            i = len(names)
+            names.append(unique_name(schema.tsids[i], schema.names[i], seen))
+            if metadata:
+                metadata.write(json.dumps({
+                    'timeseries': names[i],
+                    'tsid': schema.tsids[i],
+                    'metadata': schema.metadata(i),
+                }, sort_keys=True))
+                metadata.write('\n')
+        ts = message.logical_timestamp_ms
+        for i, value in schema.values(message):
+            if value is not None:
+                yield [ts, names[i], value]
+
+
+def frame(flow, program, start, stop, resolution, max_delay, immediate=False,
+          stats=None):
+    """Execute a SignalFlow computation and return its output as a pandas
+    DataFrame, indexed by timestamp (in UTC), with one column per time
+    series.
+
+    Values are accumulated in a Block as they arrive, and only assembled
+    into a table, and timestamps converted, once the computation completes.
+    See rows() for a description of the parameters.
+    """
+    block = Block()
+    schema = None
+    for schema, message in table(flow, program, start, stop, resolution,
+                                 max_delay, immediate, stats=stats):
+        block.append(schema, message)
+
+    import pandas
+    index = pandas.to_datetime(block.timestamps(), unit='ms', utc=True)
+    index.name = 'timestamp'
+    return pandas.DataFrame(block.values(len(schema) if schema else 0),
+                            index=index,
+                            columns=schema.names if schema else [])
+
+
+def _writer(out):
+    return csv.writer(out, dialect=csv.excel, quoting=csv.QUOTE_NONNUMERIC,
+                      lineterminator='\n')
+
+
+def _line(row):
+    """Return the given row as a line of CSV text."""
+    buf = six.StringIO()
+    _writer(buf).writerow(row)
+    return buf.getvalue()
+
+
+def stream(flow, program, start, stop, resolution, max_delay, immediate=False,
+           stats=None, layout='wide', view=None):
+    """Execute a SignalFlow computation and output the results as CSV.
+
+    Generates one line of CSV text (without line terminator) per row. See
+    rows() for a description of the parameters, and write() for the
+    layout.
+    """
+    buf = six.StringIO()
+    writer = _writer(buf)
+
+    generate = long_rows if layout == 'long' else rows
+    for row in generate(flow, program, start, stop, resolution, max_delay,
+                        immediate, stats=stats, view=view):
+        writer.writerow(row)
+        line = buf.getvalue().strip()
+        buf.truncate(0)
+        buf.seek(0)
+        yield line
+
+
+def write(out, flow, program, start, stop, resolution, max_delay,
+          immediate=False, quiet=False, stats=None, layout='wide',
+          metadata=None, view=None, checkpoint=None):
+    """Execute a SignalFlow computation and write the results as CSV
+    directly into the given output.
+
+    :param out: The sink.Sink to write the CSV data to. The header row is
+        set as its header, and updated as columns are added to the wide
+        layout: each part of rotated output starts with a header naming all
+        its columns, and other outputs repeat the header row before the
+        first row with new columns (see rows()).
+    :param layout: 'wide' for one column per time series (see rows()), or
+        'long' for one row per value (see long_rows()).
+    :param metadata: For the long layout, an optional file-like object to
+        write the metadata of the time series to.
+    :param checkpoint: An optional resume.Checkpoint to record the progress
+        of the output into. When resuming from it, the output, appended to
+        the sink, continues with the columns it had.
+
+    See rows() for a description of the other parameters.
+    """
+    writer = _writer(out)
+    if layout == 'long':
+        header = False
+        for row in _long_rows(flow, program, start, stop, resolution,
+                              max_delay, immediate, quiet, stats, metadata,
+                              view, checkpoint):
+            if not header:
+                header = True
+                out.set_header(_line(_LONG_HEADER))
+            writer.writerow(row)
+        return
+
+    columns = None
+    for schema, row in _wide_rows(flow, program, start, stop, resolution,
+                                  max_delay, immediate, quiet, stats, view,
+                                  checkpoint):
+        if len(schema) != columns:
+            columns = len(schema)
+            out.set_header(_line(schema.header()))
+        writer.writerow(row)
@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2018 SignalFx, Inc. All Rights Reserved.
+
+"""Client-side filtering and grouping of the time series of a computation
+by their dimensions, narrowing or aggregating outputs without changing and
+re-executing the program."""
+
+from fnmatch import fnmatchcase
+import six
+
+# Metadata properties that aren't dimensions.
+_IGNORED_PROPERTIES = set(['sf_key', 'sf_type', 'sf_isPreQuantized',
+                           'sf_resolutionMs'])
+
+# Functions aggregating the values of the time series of a group.
+AGGREGATIONS = {
+    'sum': sum,
+    'mean': lambda values: sum(values) / float(len(values)),
+    'min': min,
+    'max': max,
+    'count': len,
+}
+
+
+class DimensionIndex(object):
+    """An inverted index of the dimensions of time series, from dimension
+    name and value to the set of tsids having that value, built as metadata
+    arrives, and pruned as time series expire. Dimension names and values
+    are interned, so that the many time series sharing them also share the
+    same string objects."""
+
+    def __init__(self):
+        self._strings = {}
+        self._index = {}
+        self._dimensions = {}
+
+    def __len__(self):
+        return len(self._dimensions)
+
+    def __contains__(self, tsid):
+        return tsid in self._dimensions
+
+    def _intern(self, s):
+        return self._strings.setdefault(s, s)
+
+    def add(self, tsid, metadata):
+        """Index the dimensions of the given time series, from its metadata,
+        if it isn't indexed already."""
+        if tsid in self._dimensions or not metadata:
+            return
+        dimensions = {}
+        for name, value in six.iteritems(metadata):
+            if name in _IGNORED_PROPERTIES or \
+                    not isinstance(value, six.string_types):
+                continue
+            name, value = self._intern(name), self._intern(value)
+            dimensions[name] = value
+            self._index.setdefault(name, {}).setdefault(value, set()) \
+                .add(tsid)
+        self._dimensions[tsid] = dimensions
+
+    def remove(self, tsid):
+        """Remove the given expired time series from the index, along with
+        the dimension values no other time series has."""
+        dimensions = self._dimensions.pop(tsid, None)
+        if not dimensions:
+            return
+        for name, value in six.iteritems(dimensions):
+            values = self._index[name]
+            tsids = values[value]
+            tsids.discard(tsid)
+            if tsids:
+                continue
+            del values[value]
+            # Only the sharing of the value's string with time series
+            # added later is lost if it's also in use elsewhere.
+            self._strings.pop(value, None)
+            if not values:
+                del self._index[name]
+
+    @property
+    def tsids(self):
+        """The set of indexed tsids."""
+        return six.viewkeys(self._dimensions)
+
+    def dimensions(self, tsid):
+        """Return the dimensions of the given time series, as a dictionary,
+        or None if it isn't indexed."""
+        return self._dimensions.get(tsid)
+
+    def find(self, name, pattern):
+        """Return the set of tsids whose value of the given dimension
+        matches the given glob pattern. Only the distinct values of the
+        dimension are matched against the pattern."""
+        values = self._index.get(name, {})
+        if not any(c in pattern for c in '*?['):
+            return set(values.get(pattern, ()))
+        result = set()
+        for value, tsids in six.iteritems(values):
+            if fnmatchcase(value, pattern):
+                result |= tsids
+        return result
+
+
+class Filter(object):
+    """A filter on the dimensions of time series, made of dimension:pattern
+    terms that must all match, patterns being globs. Terms prefixed with !
+    must not match."""
+
+    def __init__(self, terms):
+        self.terms = terms
+
+    def __str__(self):
+        return ' '.join('{0}{1}:{2}'.format('!' if negate else '', name,
+                                            pattern)
+                        for name, pattern, negate in self.terms)
+
+    def match(self, index):
+        """Return the set of indexed tsids matching this filter."""
+        result = None
+        for name, pattern, negate in self.terms:
+            tsids = index.find(name, pattern)
+            if negate:
+                tsids = set(index.tsids) - tsids
+            result = tsids if result is None else result & tsids
+            if not result:
+                break
+        return result or set()
+
+    def matches(self, dimensions):
+        """Return whether a time series with the given dimensions matches
+        this filter."""
+        for name, pattern, negate in self.terms:
+            value = dimensions.get(name)
+            if (value is not None and fnmatchcase(value, pattern)) == negate:
+                return False
+        return True
+
+
+class Grouping(object):
+    """A grouping of time series by the values of some of their dimensions,
+    aggregating the values of the time series of each group."""
+
+    def __init__(self, names, aggregation='sum'):
+        self.names = names
+        self.aggregation = aggregation
+        self.aggregate = AGGREGATIONS[aggregation]
+
+    def __str__(self):
+        return '{0} by {1}'.format(self.aggregation, ','.join(self.names))
+
+    def group(self, dimensions):
+        """Return the label of the group of a time series with the given
+        dimensions. Missing dimensions are labeled with '-'."""
+        return u','.join(u'{0}:{1}'.format(name, dimensions.get(name, '-'))
+                         for name in self.names)
+
+
+def parse_filter(spec):
+    """Parse a filter specification, made of space-separated
+    dimension:pattern terms, for example 'host:web-* !az:us-east-1a'.
+    Returns a Filter, or None if the specification is empty.
+
+    Raises ValueError for invalid specifications."""
+    if not spec or not spec.strip():
+        return None
+    terms = []
+    for term in spec.split():
+        negate = term.startswith('!')
+        name, sep, pattern = term.lstrip('!').partition(':')
+        if not name or not sep or not pattern:
+            raise ValueError('Invalid filter {0}: expected dimension:pattern '
+                             'terms.'.format(spec))
+        terms.append((name, pattern, negate))
+    return Filter(terms)
+
+
+def parse_grouping(spec):
+    """Parse a grouping specification: comma-separated dimension names,
+    optionally followed by the aggregation of the values of each group, one
+    of AGGREGATIONS (default: sum), for example 'az' or 'az,region mean'.
+    Returns a Grouping, or None if the specification is empty.
+
+    Raises ValueError for invalid specifications."""
+    if not spec or not spec.strip():
+        return None
+    fields = spec.split()
+    names = [name for name in fields[0].split(',') if name]
+    if not names or len(fields) > 2 or \
+            (len(fields) == 2 and fields[1] not in AGGREGATIONS):
+        raise ValueError('Invalid grouping {0}: expected dimension names, '
+                         'optionally followed by one of {1}.'
+                         .format(spec, ', '.join(sorted(AGGREGATIONS))))
+    return Grouping(names, *fields[1:])
+
+
+class View(object):
+    """A client-side view of the time series of a computation, narrowed by
+    a Filter and aggregated by a Grouping, either being optional.
+
+    Time series are assigned to a column of the view, identified by its key
+    (the tsid of the time series, or the label of its group), as their
+    metadata arrives. The index of their dimensions is kept up to date so
+    that the view can be changed at any time."""
+
+    def __init__(self, filter=None, grouping=None, index=None):
+        self.filter = filter
+        self.grouping = grouping
+        self.index = index if index is not None else DimensionIndex()
+        self._keys = {}
+
+    def __bool__(self):
+        return bool(self.filter or self.grouping)
+
+    __nonzero__ = __bool__
+
+    def __str__(self):
+        return ', '.join(str(x) for x in [self.filter, self.grouping] if x)
+
+    def _key(self, tsid, dimensions, match):
+        key = None
+        if match:
+            key = self.grouping.group(dimensions) if self.grouping else tsid
+        self._keys[tsid] = key
+        return key
+
+    def key(self, tsid, metadata=None):
+        """Return the key of the column the given time series belongs to in
+        this view, or None if it is filtered out or unknown. Its metadata is
+        indexed first, if given."""
+        if metadata is not None:
+            self.index.add(tsid, metadata)
+        try:
+            return self._keys[tsid]
+        except KeyError:
+            pass
+        dimensions = self.index.dimensions(tsid)
+        if dimensions is None:
+            return None
+        return self._key(tsid, dimensions,
+                         not self.filter or self.filter.matches(dimensions))
+
+    def remove(self, tsid):
+        """Forget the given expired time series."""
+        self._keys.pop(tsid, None)
+        self.index.remove(tsid)
+
+    def keys(self, tsids):
+        """Return the keys of the columns the given time series belong to
+        (see key()). Time series already indexed when the view was created
+        are filtered in bulk, through the index."""
+        missing = [tsid for tsid in tsids if tsid not in self._keys]
+        if len(missing) > 1 and self.filter:
+            matched = self.filter.match(self.index)
+            for tsid in missing:
+                dimensions = self.index.dimensions(tsid)
+                if dimensions is not None:
+                    self._key(tsid, dimensions, tsid in matched)
+        return [self.key(tsid) for tsid in tsids]
+
+    def aggregate(self, values):
+        """Aggregate the given values of the time series of a group."""
+        return self.grouping.aggregate(values)
@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2018 SignalFx, Inc. All Rights Reserved.
+
+"""Parsing and export of the events emitted by detector and alert
+programs."""
+
+import collections
+import csv
+import json
+from signalfx import signalflow
+import six
+import sys
+
+from . import utils
+
+
+FORMATS = ['jsonl', 'csv']
+
+# Maximum number of parsed input contexts kept in a ContextsCache.
+_CONTEXTS_CACHE_SIZE = 4096
+
+_CSV_HEADER = ['timestamp', 'tsid', 'detector', 'label', 'incident', 'is',
+               'was', 'inputs']
+
+
+def _maybe_json(v):
+    if isinstance(v, six.string_types):
+        return json.loads(v)
+    return v
+
+
+class ContextsCache(object):
+    """A bounded, least-recently-used cache of the parsed input contexts
+    (sf_detectInputContexts) of event time series, keyed by tsid.
+
+    All the events of an event time series share the same contexts, so
+    they only need to be parsed once."""
+
+    def __init__(self, size=_CONTEXTS_CACHE_SIZE):
+        self._size = size
+        self._cache = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._cache)
+
+    def get(self, tsid, metadata):
+        """Return the input contexts of the event time series with the given
+        tsid, parsing them from the given metadata if they aren't cached
+        yet."""
+        try:
+            contexts = self._cache.pop(tsid)
+            self._cache[tsid] = contexts
+            return contexts
+        except KeyError:
+            pass
+
+        # Don't remember the lack of metadata, it may show up later.
+        if not metadata:
+            return {}
+        contexts = _maybe_json(metadata.get('sf_detectInputContexts')) or {}
+        self._cache[tsid] = contexts
+        if len(self._cache) > self._size:
+            self._cache.popitem(last=False)
+        return contexts
+
+
+class Event(object):
+    """An event emitted by a detector, parsed once from its EventMessage.
+
+    Each input of the event is resolved against the input contexts of its
+    event time series into a dictionary holding the input's name (its
+    identifier in the program), the key dimensions of the time series that
+    triggered the event, and its value."""
+
+    def __init__(self, message, metadata, contexts):
+        properties = message.properties or {}
+        metadata = metadata or {}
+        self.tsid = message.tsid
+        self.timestamp_ms = message.timestamp_ms
+        self.detector = metadata.get('sf_detector')
+        self.label = metadata.get('sf_detectLabel')
+        self.incident = properties.get('incidentId')
+        self.state = properties.get('is')
+        self.previous_state = properties.get('was')
+        self.inputs = [{
+            'name': contexts.get(k, {}).get('identifier', k),
+            'key': v.get('key', {}),
+            'value': v.get('value'),
+        } for k, v in sorted(
+            (_maybe_json(properties.get('inputs')) or {}).items())]
+
+    def record(self):
+        """Return the event as a dictionary, for export."""
+        return {
+            'timestamp': self.timestamp_ms,
+            'tsid': self.tsid,
+            'detector': self.detector,
+            'label': self.label,
+            'incident': self.incident,
+            'is': self.state,
+            'was': self.previous_state,
+            'inputs': self.inputs,
+        }
+
+    def row(self):
+        """Return the event as a CSV row, the inputs being JSON-encoded."""
+        return [self.timestamp_ms, self.tsid, self.detector, self.label,
+                self.incident, self.state, self.previous_state,
+                json.dumps(self.inputs, sort_keys=True)]
+
+
+def generate(flow, program, start, stop, resolution, max_delay,
+             immediate=False, quiet=False, stats=None):
+    """Execute a SignalFlow computation and generate an Event for each event
+    it emits. Data messages are ignored.
+
+    See csvflow.rows() for a description of the parameters.
+    """
+    def _message(msg):
+        if not quiet:
+            utils.message(msg, out=sys.stderr)
+
+    try:
+        _message('Requesting computation...')
+        c = flow.execute(program, start=start, stop=stop,
+                         resolution=resolution, max_delay=max_delay,
+                         immediate=immediate, persistent=False)
+    except Exception as e:
+        if quiet:
+            raise
+        _message('\r\033[K')
+        _message(e)
+        return
+
+    contexts = ContextsCache()
+    try:
+        messages = c.stream()
+        if stats:
+            messages = stats.track(messages, c)
+        for message in messages:
+            if isinstance(message, signalflow.messages.JobStartMessage):
+                _message(' started; waiting for events...\n')
+                continue
+
+            if isinstance(message, signalflow.messages.JobProgressMessage):
+                _message(' {0}%'.format(message.progress))
+                continue
+
+            if not isinstance(message, signalflow.messages.EventMessage):
+                continue
+
+            metadata = c.get_metadata(message.tsid)
+            yield Event(message, metadata,
+                        contexts.get(message.tsid, metadata))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        c.close()
+
+
+def write(out, flow, program, start, stop, resolution, max_delay,
+          immediate=False, quiet=False, stats=None, fmt='jsonl'):
+    """Execute a SignalFlow computation and write the events it emits into
+    the given output, as they arrive.
+
+    :param out: The sink.Sink to write the events to.
+    :param fmt: 'jsonl' for one JSON object per line, or 'csv' for a header
+        row followed by one row per event, with the event's inputs
+        JSON-encoded in the last column.
+
+    See csvflow.rows() for a description of the other parameters.
+    """
+    events = generate(flow, program, start, stop, resolution, max_delay,
+                      immediate, quiet, stats)
+    if fmt == 'csv':
+        header = six.StringIO()
+        csv.writer(header, dialect=csv.excel,
+                   lineterminator='\n').writerow(_CSV_HEADER)
+        out.set_header(header.getvalue())
+        writer = csv.writer(out, dialect=csv.excel, lineterminator='\n')
+        for event in events:
+            writer.writerow(event.row())
+    else:
+        for event in events:
+            out.write(json.dumps(event.record(), sort_keys=True))
+            out.write('\n')
@@ -5,36 +5,125 @@
 
 from __future__ import print_function
 
+import csv
 import six
 import sys
+import threading
+import time
 import tslib
 
+from . import csvflow
 from .tzaction import TimezoneAction
 
+# Default number of most recent datapoints of each time series shown by
+# streaming graphs.
+_DEFAULT_WINDOW = 1000
 
-def render(csv, tz):
-    """Render the given CSV data as simple graph.
+_DEFAULT_MAX_FPS = 10
 
-    :param csv: A block of CSV data, either as a string, a StringIO instance,
-        or a generator of lines of CSV text data.
-    :param tz: The display timezone for the time axis.
-    """
-    if isinstance(csv, six.string_types):
-        buf = six.StringIO(csv)
-    if isinstance(csv, six.StringIO):
-        buf = csv
-    if callable(getattr(csv, 'read', None)):
-        buf = csv
+
+def _read_csv(data):
+    """Read the given CSV data into a DataFrame indexed by timestamp."""
+    if isinstance(data, six.string_types):
+        buf = six.StringIO(data)
+    elif callable(getattr(data, 'read', None)):
+        buf = data
     else:
         buf = six.StringIO()
-        for line in csv:
+        for line in data:
             print(line, file=buf)
         buf.seek(0)
+    # Python 2 files and StringIO have no seekable(); buffer them too.
+    if not getattr(buf, 'seekable', lambda: False)():
+        buf = six.StringIO(buf.read())
+
+    import pandas
+    try:
+        df = pandas.read_csv(buf, index_col=0)
+    except pandas.errors.ParserError:
+        # Columns added by a schema change mid-stream make later rows wider
+        # than the first header row. The csv output repeats the header row
+        # when that happens; columns no header row names are named after
+        # their position.
+        buf.seek(0)
+        lines, names = [], []
+        for line in buf:
+            if line.startswith(('timestamp', '"timestamp"')):
+                names = next(csv.reader([line]))
+            else:
+                lines.append(line)
+        width = max(len(row) for row in csv.reader(lines))
+        names.extend('column {0}'.format(i)
+                     for i in range(len(names), width))
+        df = pandas.read_csv(six.StringIO(''.join(lines)), header=None,
+                             names=names, index_col=0)
+
+    # Millisecond timestamps, as produced by the csv output, are converted
+    # in one vectorized step; anything else goes through tslib, one value at
+    # a time.
+    if pandas.api.types.is_numeric_dtype(df.index):
+        index = pandas.to_datetime(df.index, unit='ms', utc=True)
+    else:
+        index = pandas.DatetimeIndex(df.index.map(tslib.parse_input))
+    return df.set_index(index)
+
+
+def _envelopes(values, buckets):
+    """Downsample each column of the given 2D array of values to its
+    min/max envelope over the given number of buckets of consecutive rows.
 
+    Returns, for each column, the sorted positions of the rows to keep: the
+    rows holding the minimum and maximum value of the column in each bucket,
+    so that spikes remain visible. Missing (NaN) values are ignored."""
+    import numpy
+    rows, columns = values.shape
+    size = -(-rows // buckets)
+    buckets = -(-rows // size)
+    padded = numpy.full((buckets * size, columns), numpy.nan)
+    padded[:rows] = values
+    padded = padded.reshape(buckets, size, columns)
+
+    missing = numpy.isnan(padded)
+    offsets = numpy.arange(buckets)[:, None] * size
+    lows = numpy.where(missing, numpy.inf, padded).argmin(axis=1) + offsets
+    highs = numpy.where(missing, -numpy.inf, padded).argmax(axis=1) + offsets
+    valid = ~missing.all(axis=1)
+
+    return [numpy.unique(numpy.concatenate((lows[valid[:, i], i],
+                                            highs[valid[:, i], i])))
+            for i in range(columns)]
+
+
+def _plot_envelopes(ax, df, buckets):
+    """Plot the min/max envelope of each column of the given DataFrame,
+    each column being its own line."""
+    import numpy
+    timestamps = df.index.values
+    values = numpy.asarray(df.values, dtype=float)
+    for i, positions in enumerate(_envelopes(values, buckets)):
+        ax.plot(timestamps[positions], values[positions, i],
+                label=df.columns[i])
+    ax.xaxis_date(df.index.tz)
+    ax.legend()
+
+
+def render(data, tz):
+    """Render the given data as simple graph.
+
+    :param data: A pandas DataFrame indexed by timestamp, as returned by
+        csvflow.frame(), or a block of CSV data, either as a string, a
+        file-like object, or a generator of lines of CSV text data.
+    :param tz: The display timezone for the time axis.
+    """
     import pandas
-    df = pandas.read_csv(buf, index_col=0,
-                         parse_dates=True,
-                         date_parser=tslib.parse_input)
+    if isinstance(data, pandas.DataFrame):
+        df = data
+    else:
+        df = _read_csv(data)
+
+    if df.empty:
+        print('Computation complete; no data.')
+        return
     df = df.set_index(df.index.tz_convert(tz))
 
     print('Computation complete; got {0} datapoints for {1}'
@@ -45,10 +134,146 @@ def render(csv, tz):
     # Import at the last minute to avoid the window focus switch bug.
     import matplotlib.pyplot as plt
     plt.style.use('ggplot')
-    df.plot()
+    fig, ax = plt.subplots()
+
+    # Plotting more points than there are pixels across the plot is only
+    # slower; large data is downsampled to about one point per pixel.
+    buckets = int(fig.get_figwidth() * fig.dpi) // 2
+    if len(df) > 2 * buckets:
+        print('Downsampled to the min/max envelope of {0} intervals.'
+              .format(buckets))
+        _plot_envelopes(ax, df, buckets)
+    else:
+        df.plot(ax=ax)
     plt.show()
 
 
+class StreamingGraph(object):
+    """A graph of a computation's output, updated in place as data arrives.
+
+    The computation is consumed by a background thread into a sliding
+    csvflow.Window, while the main thread runs the GUI event loop and
+    redraws the graph, at most max_fps times per second, by updating the
+    data of each line rather than re-plotting everything."""
+
+    def __init__(self, tz, window=_DEFAULT_WINDOW, max_fps=_DEFAULT_MAX_FPS,
+                 stats=None):
+        self._tz = tz
+        self._frame_interval = 1.0 / max_fps if max_fps else 0.001
+        self._stats = stats
+        self._window = csvflow.Window(window)
+        self._schema = None
+        self._version = 0
+        self._drawn = 0
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._stopped = threading.Event()
+        self._error = None
+        self._lines = []
+
+    def _consume(self, table):
+        try:
+            for schema, message in table:
+                with self._lock:
+                    self._schema = schema
+                    self._window.append(schema, message)
+                    self._version += 1
+                if self._stopped.is_set():
+                    break
+        except Exception as e:
+            self._error = e
+        finally:
+            table.close()
+            self._done.set()
+
+    def _draw(self, ax):
+        """Update the lines of the graph with the data in the window, if it
+        changed since the last frame."""
+        started = time.time()
+        with self._lock:
+            if self._version == self._drawn:
+                return
+            self._drawn = self._version
+            names = list(self._schema.names)
+            timestamps = self._window.timestamps().astype('datetime64[ms]')
+            values = self._window.values(len(names)).copy()
+
+        # Columns of expired time series are reused by new ones, keeping
+        # their previous label until then.
+        relabel = False
+        for line, name in zip(self._lines, names):
+            if name is not None and line.get_label() != name:
+                line.set_label(name)
+                relabel = True
+        if len(names) > len(self._lines):
+            for name in names[len(self._lines):]:
+                line, = ax.plot([], [], label=name)
+                self._lines.append(line)
+            relabel = True
+        if relabel:
+            ax.legend(loc='upper left')
+        for i, line in enumerate(self._lines):
+            line.set_data(timestamps, values[:, i])
+        ax.relim()
+        ax.autoscale_view()
+        ax.figure.canvas.draw_idle()
+        if self._stats:
+            self._stats.add_render_time(time.time() - started)
+
+    def show(self, table):
+        """Graph the (schema, message) pairs generated by the given
+        csvflow.table() generator until it ends, the graph window is closed,
+        or the user interrupts it."""
+        # Import at the last minute to avoid the window focus switch bug.
+        import matplotlib.pyplot as plt
+        plt.style.use('ggplot')
+        plt.ion()
+        fig, ax = plt.subplots()
+        ax.xaxis_date(self._tz)
+
+        consumer = threading.Thread(target=self._consume, args=(table,))
+        consumer.daemon = True
+        consumer.start()
+        try:
+            while not self._done.is_set() and plt.fignum_exists(fig.number):
+                self._draw(ax)
+                plt.pause(self._frame_interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._stopped.set()
+            plt.ioff()
+
+        if self._error or not self._done.is_set():
+            plt.close(fig)
+            if self._error:
+                raise self._error
+        elif plt.fignum_exists(fig.number):
+            # Keep the complete graph open until the window is closed.
+            self._draw(ax)
+            print('Computation complete; got {0} datapoints.'
+                  .format(len(self._window)))
+            plt.show()
+
+
+def stream(flow, tz, program, start, stop, resolution, max_delay,
+           immediate=False, window=_DEFAULT_WINDOW, max_fps=_DEFAULT_MAX_FPS,
+           stats=None):
+    """Execute a SignalFlow computation and graph its output as it streams
+    in, which makes it suitable for computations with no fixed stop. Only
+    the most recent datapoints of each time series are kept and shown.
+
+    :param window: The number of most recent datapoints shown.
+    :param max_fps: The maximum number of times per second the graph is
+        redrawn, or None for no limit.
+
+    See csvflow.rows() for a description of the other parameters.
+    """
+    table = csvflow.table(flow, program, start, stop, resolution, max_delay,
+                          immediate, stats=stats, expire=True)
+    StreamingGraph(tz, window, max_fps, stats).show(table)
+
+
 def main():
     import argparse
     parser = argparse.ArgumentParser(
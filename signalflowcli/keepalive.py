@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2018 SignalFx, Inc. All Rights Reserved.
+
+from signalfx import signalflow
+import threading
+import time
+
+# Default interval between connection checks while idle, in seconds.
+_DEFAULT_INTERVAL = 600
+
+# A trivial program, executed over a short time range in the past to open
+# the connection, or check it, through the client's public interface.
+_WARMUP_PROGRAM = 'const(0).publish()'
+_WARMUP_RESOLUTION = 60000
+
+# Maximum time to wait for the warm-up computation to start, in seconds.
+_WARMUP_TIMEOUT = 30
+
+
+class KeepAliveFlow(object):
+    """Wraps a SignalFlow client to establish its stream connection ahead of
+    time, in a background thread, so that executing a computation doesn't
+    have to wait for the connection to be opened and authenticated.
+
+    The connection is opened by executing a trivial warm-up computation,
+    and closing it once it started. This happens when the flow is created,
+    after each computation is closed, and every interval seconds while no
+    computation is running, which has the client re-establish the
+    connection if it was dropped, the same way it does for any other
+    computation. Computations are executed right away, even while warming
+    up."""
+
+    def __init__(self, flow, interval=_DEFAULT_INTERVAL):
+        self._flow = flow
+        self._interval = interval
+        # Protects the number of active computations.
+        self._lock = threading.Lock()
+        self._active = 0
+        self._closed = False
+        # Set to have the background thread warm up the connection.
+        self._wake = threading.Event()
+
+        self._thread = None
+        if interval:
+            self._wake.set()
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _idle(self):
+        with self._lock:
+            return not self._active and not self._closed
+
+    def _warm_up(self):
+        """Execute the warm-up computation until it starts, which requires
+        the connection to be established and authenticated, or until the
+        warm-up timeout."""
+        now = int(time.time() * 1000)
+        now -= now % _WARMUP_RESOLUTION
+        c = self._flow.execute(_WARMUP_PROGRAM,
+                               start=now - 2 * _WARMUP_RESOLUTION,
+                               stop=now - _WARMUP_RESOLUTION,
+                               resolution=_WARMUP_RESOLUTION,
+                               persistent=False)
+        # Closing the computation ends its stream.
+        timeout = threading.Timer(_WARMUP_TIMEOUT, c.close)
+        timeout.daemon = True
+        timeout.start()
+        try:
+            for message in c.stream():
+                if isinstance(message, signalflow.messages.JobStartMessage):
+                    break
+        finally:
+            timeout.cancel()
+            c.close()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self._interval)
+            self._wake.clear()
+            if self._closed:
+                return
+            if self._idle():
+                try:
+                    self._warm_up()
+                except Exception:
+                    # Retried at the next interval, or by the next
+                    # execution.
+                    pass
+
+    def _done(self):
+        with self._lock:
+            self._active -= 1
+        self._wake.set()
+
+    def execute(self, program, **kwargs):
+        c = self._flow.execute(program, **kwargs)
+        with self._lock:
+            self._active += 1
+        return KeepAliveComputation(c, self._done)
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+        self._flow.close()
+
+
+class KeepAliveComputation(object):
+    """Wraps a computation to notify its KeepAliveFlow when it is closed."""
+
+    def __init__(self, computation, on_close):
+        self._computation = computation
+        self._on_close = on_close
+
+    def __getattr__(self, name):
+        return getattr(self._computation, name)
+
+    def close(self):
+        try:
+            self._computation.close()
+        finally:
+            if self._on_close:
+                self._on_close()
+                self._on_close = None
@@ -6,91 +6,301 @@
 from __future__ import print_function
 
 from ansicolor import green, red, white
-import json
+import collections
+import numpy
 import tslib
 from signalfx import signalflow
-import six
-
-from . import utils
+import sys
+import threading
+import time
+
+from . import dimensions, events, utils
+
+
+class Sparklines(object):
+    """Sparkline history of a set of time series, kept in a ring buffer.
+
+    Values are stored in a single 2D array with one row per time series and
+    one column per tick, with a moving head pointer designating the column of
+    the current tick. Ticking only clears the new head column, and all
+    sparklines are rendered in one batch. Missing values are NaN."""
+
+    def __init__(self, width=10, capacity=64):
+        self._width = width
+        self._head = 0
+        self._tsids = []
+        self._index = {}
+        self._values = numpy.full((capacity, width), numpy.nan)
+        # Latest raw values, kept apart to preserve their type for display.
+        self._latest = numpy.empty(capacity, dtype=object)
+
+    def __len__(self):
+        return len(self._tsids)
+
+    @property
+    def tsids(self):
+        return self._tsids
+
+    @property
+    def latest(self):
+        return self._latest[:len(self._tsids)]
+
+    def _grow(self):
+        capacity = 2 * len(self._values)
+        values = numpy.full((capacity, self._width), numpy.nan)
+        values[:len(self._values)] = self._values
+        latest = numpy.empty(capacity, dtype=object)
+        latest[:len(self._latest)] = self._latest
+        self._values, self._latest = values, latest
+
+    def add(self, tsid, value):
+        """Set the value of the given time series for the current tick."""
+        row = self._index.get(tsid)
+        if row is None:
+            row = len(self._tsids)
+            if row == len(self._values):
+                self._grow()
+            self._index[tsid] = row
+            self._tsids.append(tsid)
+        self._values[row, self._head] = \
+            numpy.nan if value is None else value
+        self._latest[row] = value
+
+    def tick(self):
+        """Tick (advance) all sparklines."""
+        self._head = (self._head + 1) % self._width
+        n = len(self._tsids)
+        self._values[:n, self._head] = numpy.nan
+        self._latest[:n] = None
+
+    def view(self, keys, aggregation=None):
+        """Return new Sparklines holding the rows of the given keys, one
+        per row of these sparklines, rows with a None key being left out.
+
+        Without aggregation, each key must be unique. Otherwise, the rows
+        sharing the same key are aggregated into one, with the given
+        dimensions.AGGREGATIONS function, ignoring missing values."""
+        groups = collections.OrderedDict()
+        for row, key in enumerate(keys):
+            if key is not None:
+                groups.setdefault(key, []).append(row)
+
+        result = Sparklines(self._width, max(1, len(groups)))
+        result._head = self._head
+        result._tsids = list(groups)
+        result._index = dict((key, i) for i, key in enumerate(groups))
+        if not groups:
+            return result
+
+        rows = numpy.fromiter((row for group in groups.values()
+                               for row in group), dtype=int)
+        if not aggregation:
+            result._values[:] = self._values[rows]
+            result._latest[:] = self._latest[rows]
+            return result
+
+        # Reduce the contiguous runs of rows of each group, in one batch.
+        values = self._values[rows]
+        starts = numpy.cumsum([0] + [len(g) for g in groups.values()])[:-1]
+        missing = numpy.isnan(values)
+        count = numpy.add.reduceat(~missing, starts)
+        if aggregation == 'count':
+            aggregated = count.astype(float)
+        elif aggregation == 'min':
+            aggregated = numpy.minimum.reduceat(
+                numpy.where(missing, numpy.inf, values), starts)
+        elif aggregation == 'max':
+            aggregated = numpy.maximum.reduceat(
+                numpy.where(missing, -numpy.inf, values), starts)
+        else:
+            aggregated = numpy.add.reduceat(
+                numpy.where(missing, 0, values), starts)
+            if aggregation == 'mean':
+                aggregated /= numpy.maximum(count, 1)
+        aggregated[count == 0] = numpy.nan
+        result._values[:] = aggregated
+
+        cast = int if aggregation == 'count' else float
+        result._latest[:] = [None if numpy.isnan(v) else cast(v)
+                             for v in aggregated[:, self._head]]
+        return result
+
+    def select(self, selection):
+        """Return the rows of the time series picked by the given
+        selection.Selection, in display order.
+
+        The count largest (or smallest) time series are found by partial
+        selection, in linear time, and only they are sorted, so a selection
+        over n time series costs O(n + K log K) rather than a full sort.
+        Time series with no current value are never selected."""
+        n = len(self._tsids)
+        ranks = self._values[:n, self._head]
+        if selection.rate:
+            ranks = ranks - self._values[:n, self._head - 1]
+
+        with numpy.errstate(invalid='ignore'):
+            keep = ~numpy.isnan(ranks)
+            if selection.threshold is not None:
+                keep &= ranks > selection.threshold if selection.above \
+                    else ranks < selection.threshold
+        rows = numpy.flatnonzero(keep)
+        if not selection.count:
+            return rows
+
+        keys = -ranks[rows] if selection.largest else ranks[rows]
+        if len(rows) > selection.count:
+            part = numpy.argpartition(keys, selection.count - 1)
+            rows, keys = rows[part[:selection.count]], \
+                keys[part[:selection.count]]
+        return rows[numpy.argsort(keys, kind='stable')]
+
+    def tick_indices(self, levels, rows=None):
+        """Return the tick index, between 0 and levels - 1, of each value of
+        each sparkline (or of the sparklines of the given rows only), oldest
+        first.
+
+        Missing and zero values map to the blank tick 0 and are ignored for
+        scaling; flat sparklines map entirely to the middle tick 3."""
+        order = (self._head + 1 + numpy.arange(self._width)) % self._width
+        values = self._values[:len(self._tsids)]
+        if rows is not None:
+            values = values[rows]
+        values = values[:, order]
+        missing = numpy.isnan(values) | (values == 0)
+
+        minimum = numpy.where(missing, numpy.inf, values).min(axis=1)
+        maximum = numpy.where(missing, -numpy.inf, values).max(axis=1)
+        flat = ~(minimum < maximum)
+        span = numpy.where(flat, 1, maximum - minimum)
+        minimum = numpy.where(flat, 0, minimum)
+
+        scaled = numpy.where(missing, 0, values - minimum[:, None])
+        indices = 1 + ((levels - 2) * scaled / span[:, None]).astype(int)
+        indices[missing] = 0
+        indices[flat] = 3
+        return indices
 
 
 class LiveOutputDisplay(object):
 
     _DATE_FORMAT = '%Y-%m-%d %H:%M:%S %Z (%z)'
     _TICKS = [u' ', u'▁', u'▂', u'▃', u'▅', u'▆', u'▇']
+    _TICKS_ARRAY = numpy.array(_TICKS)
     _LATEST_EVENTS_COUNT = 5
+    _DEFAULT_MAX_FPS = 10
+    _REPR_WIDTH = 60
 
-    def __init__(self, computation, tz):
+    def __init__(self, computation, tz, max_fps=_DEFAULT_MAX_FPS,
+                 out=sys.stdout, stats=None, repr_width=None,
+                 selection=None, view=None):
         self._computation = computation
         self._tz = tz
+        self._out = out
+        self._stats = stats
+        # Width of the time series representation column. Representations
+        # are only truncated when it is set explicitly.
+        self._repr_width = repr_width
+        # Optional selection.Selection of the time series to show.
+        self._selection = selection
+        # View filtering and grouping the time series by their dimensions,
+        # indexed as their metadata arrives.
+        self._view = view if view is not None else dimensions.View()
 
         # Sparkline data
-        self._sparks = {}
-
-        # Latest events (up to _LATEST_EVENTS_COUNT)
-        self._events = []
-
-    def _add_to_spark(self, tsid, value):
-        """Add the given value to a time series' sparkline."""
-        if tsid not in self._sparks:
-            self._sparks[tsid] = [None] * 10
-        self._sparks[tsid][-1] = value
-
-    def _tick_sparks(self):
-        """Tick (advance) all sparklines."""
-        for tsid in self._sparks.keys():
-            self._sparks[tsid] = self._sparks[tsid][1:] + [None]
+        self._sparks = Sparklines()
+
+        # Latest events (up to _LATEST_EVENTS_COUNT), most recent first,
+        # parsed when received.
+        self._events = collections.deque(
+            maxlen=LiveOutputDisplay._LATEST_EVENTS_COUNT)
+        self._contexts = events.ContextsCache()
+        # Representations of the computation's live time series.
+        self._reprs = utils.TimeseriesReprCache()
+
+        # Rendering happens in a separate thread, drawing at most max_fps
+        # frames per second, to coalesce bursts of messages. The lock
+        # protects the display state shared between the two threads.
+        self._frame_interval = 1.0 / max_fps if max_fps else 0
+        self._lock = threading.Lock()
+        self._dirty = threading.Event()
+        self._done = threading.Event()
+        self._error = None
+
+        # Lines of the last drawn frame
+        self._frame = []
 
     def _render_date(self, date):
         return (date.astimezone(self._tz)
                 .strftime(LiveOutputDisplay._DATE_FORMAT))
 
-    def _render_spark_line(self, spark):
-        """Return a visual representation of a time series' sparkline."""
-        values = list(filter(None, spark))
-        maximum = max(values) if values else None
-        minimum = min(values) if values else None
-
-        def to_tick_index(v):
-            if minimum == maximum:
-                return 3
-            if not v:
-                return 0
-            return 1 + int((len(LiveOutputDisplay._TICKS) - 2) *
-                           (v - minimum) / (maximum - minimum))
-
-        return ''.join(map(
-            lambda v: LiveOutputDisplay._TICKS[to_tick_index(v)],
-            spark))
+    def set_view(self, selection=None, filter=None, grouping=None):
+        """Change the selection, filter and grouping of the time series
+        shown. The dimensions index is kept, so the new view applies
+        immediately, including to the data already received."""
+        with self._lock:
+            self._selection = selection
+            self._view = dimensions.View(filter, grouping, self._view.index)
+            self._dirty.set()
+
+    def _render_spark_lines(self, sparks, rows=None):
+        """Return a visual representation of each time series' sparkline,
+        or of those of the given rows only."""
+        ticks = LiveOutputDisplay._TICKS_ARRAY[
+            sparks.tick_indices(len(LiveOutputDisplay._TICKS), rows)]
+        return [u''.join(line) for line in ticks]
 
     def _render_latest_data(self):
         """Render the latest data with sparkline for each timeseries."""
         date = tslib.date_from_utc_ts(self._computation.last_logical_ts)
-        print('\033[K\rAt {date} (@{resolution}, Δ: {lag}):'.format(
+        lines = [u'At {date} (@{resolution}, Δ: {lag}):'.format(
             date=white(self._render_date(date), bold=True),
             resolution=tslib.render_delta(self._computation.resolution)
             if self._computation.resolution else '-',
-            lag=tslib.render_delta_from_now(date)))
+            lag=tslib.render_delta_from_now(date))]
 
         if not len(self._sparks):
-            print('(no data)')
-            return 2
-
-        for tsid, spark in self._sparks.items():
-            metadata = self._computation.get_metadata(tsid)
-            print(u'\033[K\r{repr:<60}: [{spark:10s}] '
-                  .format(repr=utils.timeseries_repr(metadata) or '',
-                          spark=self._render_spark_line(spark)),
-                  end='')
-            value = spark[-1]
+            lines.append('(no data)')
+            return lines
+
+        sparks = self._sparks
+        if self._view:
+            sparks = sparks.view(
+                self._view.keys(sparks.tsids),
+                self._view.grouping.aggregation if self._view.grouping
+                else None)
+        tsids, latest = sparks.tsids, sparks.latest
+        rows = None
+        if self._selection:
+            rows = sparks.select(self._selection)
+            tsids, latest = [tsids[i] for i in rows], latest[rows]
+        if self._view or self._selection:
+            lines[0] = u'{0}, {1} ({2} shown, {3} time series):'.format(
+                lines[0][:-1],
+                ', '.join(str(x) for x in [self._view, self._selection] if x),
+                len(tsids), len(self._sparks))
+
+        for tsid, spark, value in zip(tsids,
+                                      self._render_spark_lines(sparks, rows),
+                                      latest):
+            if self._view.grouping:
+                name = tsid
+            else:
+                metadata = self._computation.get_metadata(tsid)
+                name = self._reprs.get(tsid, metadata) or ''
+            if self._repr_width:
+                name = name[:self._repr_width]
+            line = u'{repr:<{width}}: [{spark:10s}] '.format(
+                repr=name, spark=spark,
+                width=self._repr_width or LiveOutputDisplay._REPR_WIDTH)
             if type(value) == int:
-                print('\033[;1m{0:>10d}\033[;0m'.format(value))
+                line += '\033[;1m{0:>10d}\033[;0m'.format(value)
             elif type(value) == float:
-                print('\033[;1m{0:>10.2f}\033[;0m'.format(value))
+                line += '\033[;1m{0:>10.2f}\033[;0m'.format(value)
             else:
-                print('{:>10s}'.format('-'))
+                line += '{:>10s}'.format('-')
+            lines.append(line)
 
-        return len(self._sparks) + 1
+        return lines
 
     def _render_latest_events(self):
         """Render the latest events emitted by the computation.
@@ -98,80 +308,142 @@ class LiveOutputDisplay(object):
         TODO(mpetazzoni): render custom events/alert events differently and
         support alert event schema v3.
         """
-        print('\nEvents:')
-
-        def maybe_json(v):
-            if isinstance(v, six.string_types):
-                return json.loads(v)
-            return v
+        lines = ['', 'Events:']
 
         for event in self._events:
-            ets = self._computation.get_metadata(event.tsid)
-            contexts = json.loads(ets.get('sf_detectInputContexts', '{}'))
-
-            values = maybe_json(event.properties.get('inputs', '{}'))
             values = ' | '.join([
                 u'{name} ({key}): {value}'.format(
-                    name=white(contexts[k].get('identifier', k)),
+                    name=white(v['name']),
                     key=','.join([u'{0}:{1}'.format(dim_name, dim_value)
                                   for dim_name, dim_value
-                                  in v.get('key', {}).items()]),
+                                  in v['key'].items()]),
                     value=v['value'])
-                for k, v in values.items()])
+                for v in event.inputs])
 
             date = tslib.date_from_utc_ts(event.timestamp_ms)
-            is_now = event.properties['is']
 
-            print(u' {mark} {date} [{incident}]: {values}'
-                  .format(mark=green(u'✓') if is_now == 'ok' else red(u'✗'),
-                          date=white(self._render_date(date), bold=True),
-                          incident=event.properties['incidentId'],
-                          values=values))
+            lines.append(u' {mark} {date} [{incident}]: {values}'.format(
+                mark=green(u'✓') if event.state == 'ok' else red(u'✗'),
+                date=white(self._render_date(date), bold=True),
+                incident=event.incident,
+                values=values))
 
-        return 2 + len(self._events)
+        return lines
 
-    def _render(self):
-        """Render the data display. Starts by displaying the received data,
-        followed by the events."""
-        lines = 0
+    def render(self):
+        """Render the lines of the data display. Starts by rendering the
+        received data, followed by the events."""
+        lines = []
         if self._computation.last_logical_ts:
-            lines += self._render_latest_data()
+            lines.extend(self._render_latest_data())
         if self._events:
-            lines += self._render_latest_events()
-        utils.message('\033[{0}A'.format(lines))
+            lines.extend(self._render_latest_events())
+        return lines
+
+    def _draw(self):
+        """Draw a new frame of the display, with a single write that only
+        rewrites the lines that changed since the previous frame. The cursor
+        is left at the top of the frame."""
+        started = time.time()
+        lines = self.render()
+        buf = []
+        for i, line in enumerate(lines):
+            if i < len(self._frame) and self._frame[i] == line:
+                buf.append('\n')
+            else:
+                buf.append(u'\r\033[K{0}\n'.format(line))
+        if len(lines) < len(self._frame):
+            buf.append('\033[J')
+        if lines:
+            buf.append('\033[{0}A'.format(len(lines)))
+        self._frame = lines
+        utils.message(u''.join(buf), out=self._out)
+        if self._stats:
+            self._stats.add_render_time(time.time() - started)
+
+    def _render_loop(self):
+        """Draw frames whenever the display state changed, at most once per
+        frame interval."""
+        try:
+            while not self._done.is_set():
+                self._dirty.wait()
+                self._dirty.clear()
+                with self._lock:
+                    self._draw()
+                self._done.wait(self._frame_interval)
+        except Exception as e:
+            self._error = e
+
+    def update(self, message):
+        """Update the display state with the given message. Returns whether
+        the display needs to be redrawn."""
+        if isinstance(message, signalflow.messages.DataMessage):
+            self._sparks.tick()
+            for tsid, value in message.data.items():
+                self._sparks.add(tsid, value)
+            return True
+        if isinstance(message, signalflow.messages.MetadataMessage):
+            self._view.index.add(message.tsid, message.properties)
+            return False
+        if isinstance(message, signalflow.messages.ExpiredTsIdMessage):
+            self._reprs.expire(message.tsid)
+            self._view.remove(message.tsid)
+            return False
+        if isinstance(message, signalflow.messages.EventMessage):
+            metadata = self._computation.get_metadata(message.tsid)
+            self._events.appendleft(events.Event(
+                message, metadata,
+                self._contexts.get(message.tsid, metadata)))
+            return True
+        return False
+
+    def _consume(self):
+        """Consume the computation's stream, updating the display state."""
+        messages = self._computation.stream()
+        if self._stats:
+            messages = self._stats.track(messages, self._computation)
+        for message in messages:
+            if isinstance(message, signalflow.messages.JobStartMessage):
+                utils.message(' started; waiting for data...',
+                              out=self._out)
+                continue
+
+            if isinstance(message, signalflow.messages.JobProgressMessage):
+                utils.message(' {0}%'.format(message.progress),
+                              out=self._out)
+                continue
+
+            with self._lock:
+                if self.update(message):
+                    self._dirty.set()
+
+    def _close(self):
+        self._computation.close()
 
     def stream(self):
+        renderer = threading.Thread(target=self._render_loop)
+        renderer.daemon = True
+        renderer.start()
         try:
-            for message in self._computation.stream():
-                if isinstance(message, signalflow.messages.JobStartMessage):
-                    utils.message(' started; waiting for data...')
-                    continue
-
-                if isinstance(message, signalflow.messages.JobProgressMessage):
-                    utils.message(' {0}%'.format(message.progress))
-                    continue
-
-                # Messages types below all trigger a re-render.
-                if isinstance(message, signalflow.messages.DataMessage):
-                    self._tick_sparks()
-                    for tsid, value in message.data.items():
-                        self._add_to_spark(tsid, value)
-                    self._render()
-                elif isinstance(message, signalflow.messages.EventMessage):
-                    if len(self._events) == \
-                            LiveOutputDisplay._LATEST_EVENTS_COUNT:
-                        self._events.pop()
-                    self._events.insert(0, message)
-                    self._render()
+            self._consume()
         except KeyboardInterrupt:
             pass
         finally:
-            print('\033[{0}B'.format(len(self._sparks)+len(self._events)+2))
-            self._computation.close()
+            self._done.set()
+            self._dirty.set()
+            renderer.join()
+            if not self._error:
+                self._draw()
+            utils.message('\033[{0}B\n'.format(len(self._frame))
+                          if self._frame else '\n', out=self._out)
+            self._close()
+        if self._error:
+            raise self._error
 
 
 def stream(flow, tz, program, start, stop, resolution, max_delay,
-           immediate=False):
+           immediate=False, max_fps=LiveOutputDisplay._DEFAULT_MAX_FPS,
+           stats=None, selection=None, view=None):
     """Execute a streaming SignalFlow computation and display the results in
     the terminal with live sparklines.
 
@@ -186,6 +458,17 @@ def stream(flow, tz, program, start, stop, resolution, max_delay,
         for automatic.
     :param immediate: Whether to offset by max_delay and return immediate
         results (not always desirable).
+    :param max_fps: The maximum number of frames per second drawn by the
+        display, or None for no limit.
+    :param stats: An optional stats.StreamStats, created right before the
+        call, to collect statistics about the computation's message stream.
+    :param selection: An optional selection.Selection of the time series to
+        display, for computations outputting many time series.
+    :param view: An optional dimensions.View filtering and grouping the time
+        series displayed.
+
+    Returns the display, which keeps the latest state of the computation's
+    output, or None if the computation could not be executed.
     """
     utils.message('Requesting computation... ')
     try:
@@ -201,6 +484,9 @@ def stream(flow, tz, program, start, stop, resolution, max_delay,
         return
 
     try:
-        LiveOutputDisplay(c, tz).stream()
+        display = LiveOutputDisplay(c, tz, max_fps=max_fps, stats=stats,
+                                    selection=selection, view=view)
+        display.stream()
+        return display
     except Exception as e:
         print('Oops ;-( {}'.format(e))
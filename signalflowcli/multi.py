@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2018 SignalFx, Inc. All Rights Reserved.
+
+from __future__ import print_function
+
+from ansicolor import red, white
+import os
+import re
+from signalfx import signalflow
+from six.moves import queue
+import sys
+import threading
+
+from . import batch, dimensions, live, utils
+
+# Computation parameters that can be set for each panel in a manifest.
+_PARAMS = ['start', 'stop', 'resolution', 'max_delay', 'immediate']
+
+_MIN_PANEL_WIDTH = 60
+_DEFAULT_WIDTH = 80
+_SEPARATOR = u' │ '
+
+# Width of a rendered data line besides the time series representation.
+_DATA_LINE_WIDTH = 25
+
+_ANSI_ESCAPE = re.compile(r'(\033\[[0-9;]*[A-Za-z])')
+
+
+def panels(path):
+    """Return the (path, params) pairs of the panels designated by the given
+    path: either all the program files in a directory, or the files listed
+    in a manifest file, one per line (see batch.programs()).
+
+    In a manifest, each program file may be followed by computation
+    parameters overriding the defaults for this panel, as param=value pairs,
+    for example: 'cpu.flow start=-1h resolution=1m'."""
+    if os.path.isdir(path):
+        return [(p, {}) for p in batch.programs(path)]
+
+    base = os.path.dirname(path)
+    result = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip() or line.startswith('#'):
+                continue
+            fields = line.split()
+            params = {}
+            for field in fields[1:]:
+                k, sep, v = field.partition('=')
+                if not sep or k not in _PARAMS:
+                    raise ValueError('Invalid panel parameter {0} in {1}!'
+                                     .format(field, path))
+                params[k] = v.lower() in ['1', 'true', 'yes'] \
+                    if k == 'immediate' else v
+            result.append((os.path.join(base, fields[0]), params))
+    return result
+
+
+def multiplex(computations):
+    """Consume the streams of the given computations concurrently, each in
+    its own thread, and generate (index, message) tuples in the order
+    messages arrive.
+
+    The end of a computation's stream is signaled by a None message. A
+    computation that fails generates the exception it raised as its last
+    message, before its end; the others keep going."""
+    q = queue.Queue()
+
+    def _consume(i, c):
+        try:
+            for message in c.stream():
+                q.put((i, message))
+        except Exception as e:
+            q.put((i, e))
+        finally:
+            q.put((i, None))
+
+    for i, c in enumerate(computations):
+        t = threading.Thread(target=_consume, args=(i, c))
+        t.daemon = True
+        t.start()
+
+    remaining = len(computations)
+    while remaining:
+        i, message = q.get()
+        if message is None:
+            remaining -= 1
+        yield i, message
+
+
+def _fit(line, width):
+    """Truncate or pad the given line to the given visible width, ignoring
+    ANSI escape sequences."""
+    parts = []
+    visible = 0
+    for part in _ANSI_ESCAPE.split(line):
+        if _ANSI_ESCAPE.match(part):
+            parts.append(part)
+            continue
+        part = part[:width - visible]
+        parts.append(part)
+        visible += len(part)
+    if len(parts) > 1:
+        parts.append('\033[0m')
+    return u''.join(parts) + u' ' * (width - visible)
+
+
+class PanelsOutputDisplay(live.LiveOutputDisplay):
+    """A live display of several computations, each rendered with its
+    sparklines and events in its own panel. Panels are laid out side by
+    side, in as many columns as the terminal's width allows."""
+
+    def __init__(self, computations, titles, tz,
+                 max_fps=live.LiveOutputDisplay._DEFAULT_MAX_FPS,
+                 out=sys.stdout, selection=None, view=None):
+        super(PanelsOutputDisplay, self).__init__(None, tz, max_fps, out)
+        self._computations = computations
+        self._titles = titles
+        self._failed = [c is None for c in computations]
+        self._status = ['requesting...' if c else red('failed!')
+                        for c in computations]
+        self._panels = [
+            live.LiveOutputDisplay(
+                c, tz, repr_width=_MIN_PANEL_WIDTH - _DATA_LINE_WIDTH,
+                selection=selection,
+                view=dimensions.View(view.filter, view.grouping)
+                if view else None)
+            if c else None for c in computations]
+
+    def _width(self):
+        """Return the width of the terminal, from the COLUMNS environment
+        variable if set, or from the output if it is a terminal."""
+        if os.environ.get('COLUMNS', '').isdigit():
+            return int(os.environ['COLUMNS'])
+        try:
+            return os.get_terminal_size(self._out.fileno()).columns
+        except (AttributeError, OSError, ValueError):
+            return _DEFAULT_WIDTH
+
+    def _render_panel(self, i, width):
+        lines = [u'{0} {1}'.format(white(self._titles[i], bold=True),
+                                   self._status[i])]
+        if self._panels[i]:
+            self._panels[i]._repr_width = max(
+                10, width - _DATA_LINE_WIDTH)
+            lines.extend(self._panels[i].render() or ['(no data)'])
+        return [_fit(line, width) for line in lines]
+
+    def render(self):
+        width = self._width()
+        columns = max(1, min(len(self._panels),
+                             (width + len(_SEPARATOR)) //
+                             (_MIN_PANEL_WIDTH + len(_SEPARATOR))))
+        panel_width = (width - (columns - 1) * len(_SEPARATOR)) // columns
+
+        lines = []
+        for first in range(0, len(self._panels), columns):
+            if lines:
+                lines.append('')
+            row = [self._render_panel(i, panel_width) for i in
+                   range(first, min(first + columns, len(self._panels)))]
+            for n in range(max(len(panel) for panel in row)):
+                lines.append(_SEPARATOR.join(
+                    panel[n] if n < len(panel) else u' ' * panel_width
+                    for panel in row).rstrip())
+        return lines
+
+    def _consume(self):
+        running = [c for c in self._computations if c]
+        indices = [i for i, c in enumerate(self._computations) if c]
+        self._dirty.set()
+        for n, message in multiplex(running):
+            i = indices[n]
+            with self._lock:
+                if message is None:
+                    if not self._failed[i]:
+                        self._status[i] = 'complete.'
+                elif isinstance(message, Exception):
+                    self._failed[i] = True
+                    self._status[i] = red(u'failed: {0}'.format(message))
+                elif isinstance(message,
+                                signalflow.messages.JobStartMessage):
+                    self._status[i] = 'started.'
+                elif isinstance(message,
+                                signalflow.messages.JobProgressMessage):
+                    self._status[i] = '{0}%'.format(message.progress)
+                elif not self._panels[i].update(message):
+                    continue
+                self._dirty.set()
+
+    def _close(self):
+        for c in self._computations:
+            if c:
+                c.close()
+
+
+def stream(flow, tz, programs,
+           max_fps=live.LiveOutputDisplay._DEFAULT_MAX_FPS, selection=None,
+           view=None):
+    """Execute several SignalFlow computations concurrently and display
+    their results side by side in the terminal, each in its own panel with
+    live sparklines.
+
+    :param flow: An open SignalFlow client connection, shared by all
+        computations.
+    :param tz: A pytz timezone for date and time representations.
+    :param programs: A list of (title, program, params) tuples, params being
+        a dictionary of the computation parameters of the program (see
+        live.stream()).
+    :param max_fps: The maximum number of frames per second drawn by the
+        display, or None for no limit.
+    :param selection: An optional selection.Selection of the time series
+        displayed in each panel.
+    :param view: An optional dimensions.View filtering and grouping the time
+        series displayed in each panel.
+    """
+    utils.message('Requesting {0} computations... '.format(len(programs)))
+    computations = []
+    titles = []
+    for title, program, params in programs:
+        try:
+            computations.append(flow.execute(program, persistent=False,
+                                             **params))
+        except signalflow.errors.SignalFlowException as e:
+            computations.append(None)
+            title = u'{0} ({1})'.format(title, e.message or e.code)
+        titles.append(title)
+    print()
+
+    try:
+        PanelsOutputDisplay(computations, titles, tz, max_fps=max_fps,
+                            selection=selection, view=view).stream()
+    except Exception as e:
+        print('Oops ;-( {}'.format(e))
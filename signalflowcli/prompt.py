@@ -9,20 +9,19 @@ An interactive command-line prompt for running real-time streaming SignalFx
 SignalFlow Analytics.
 """
 
-from ansicolor import red, white
 import argparse
 import getpass
 import os
-import pprint
-import prompt_toolkit
-import pygments_signalflow
-import requests
 import signalfx
 from six.moves import input
 import sys
 import tslib
 
-from . import csvflow, graph, live, utils
+# Output and REPL modules, and their dependencies (numpy, pandas,
+# matplotlib, pyarrow, prompt_toolkit), are imported by the code paths that
+# use them to keep startup fast.
+from . import (buffered, cache, columnar, csvflow, events, sink,
+               utils)
 from .tzaction import TimezoneAction
 from .version import version
 
@@ -30,35 +29,8 @@ from .version import version
 # Used if no token was provided with the --token option.
 _DEFAULT_TOKEN_FILE = '~/.sftoken'
 
-
-class OptionCompleter(prompt_toolkit.completion.Completer):
-
-    OPTS = ['start', 'stop', 'resolution', 'max_delay', 'output', 'immediate']
-
-    def get_completions(self, document, complete_event):
-        for opt in self.OPTS:
-            if opt.startswith(document.text_before_cursor):
-                yield prompt_toolkit.completion.Completion(
-                        opt, start_position=-document.cursor_position)
-
-
-class PromptCompleter(prompt_toolkit.completion.Completer):
-
-    fs_completer = prompt_toolkit.completion.filesystem.PathCompleter()
-    opt_completer = OptionCompleter()
-
-    def _offset(self, document, offset=1):
-        return prompt_toolkit.document.Document(
-                document.text[offset:], document.cursor_position - offset)
-
-    def get_completions(self, document, complete_event):
-        if document.text.startswith('!'):
-            return self.fs_completer.get_completions(
-                    self._offset(document), complete_event)
-        elif document.text.startswith('.'):
-            return self.opt_completer.get_completions(
-                    self._offset(document), complete_event)
-        return []
+# Parameters of the display of the output, rather than of the computation.
+_DISPLAY_PARAMS = ['select', 'filter', 'groupby']
 
 
 def prompt_for_token(api_endpoint):
@@ -70,6 +42,7 @@ def prompt_for_token(api_endpoint):
     try:
         print()
         utils.message('Logging in as {0}... '.format(email))
+        import requests
         response = requests.post('{0}/v2/session'.format(api_endpoint),
                                  json={'email': email, 'password': password})
         response.raise_for_status()
@@ -113,9 +86,12 @@ def find_session_token(options):
 def process_params(**kwargs):
     """Process the given parameters to expand relative, human-readable time
     offsets into their absolute millisecond value or absolute millisecond
-    timestamp counterparts."""
+    timestamp counterparts. Display parameters, which don't apply to the
+    computation, are left out."""
     r = dict(kwargs)
     del r['output']
+    for k in _DISPLAY_PARAMS:
+        r.pop(k, None)
     for k, v in r.items():
         if not v:
             continue
@@ -127,89 +103,6 @@ def process_params(**kwargs):
     return r
 
 
-def prompt(flow, tz, params):
-    print(red('-*-', bold=True) + ' ' +
-          white('SignalFx SignalFlow™ Analytics Console', bold=True) + ' ' +
-          red('-*-', bold=True))
-    print()
-    print(white('Enter your program and press <Esc><Enter> to execute.'))
-    print('SignalFlow programs may span multiple lines.')
-    print('Set parameters with ".<param> <value>"; '
-          'see current settings with "."')
-    print('To stop streaming, or to exit, just press ^C.')
-    print()
-
-    def set_param(param, value=None):
-        if param not in params:
-            print('Unknown parameter {0} !'.format(param))
-            return
-        params[param] = value
-
-    history = prompt_toolkit.history.FileHistory(
-            os.path.expanduser('~/.signalflow.history'))
-    prompt = prompt_toolkit.shortcuts.PromptSession(history=history)
-
-    while True:
-        program = []
-        try:
-            prompt_args = {
-                'lexer': prompt_toolkit.lexers.PygmentsLexer(
-                    pygments_signalflow.SignalFlowLexer),
-                'auto_suggest':
-                    prompt_toolkit.auto_suggest.AutoSuggestFromHistory(),
-                'prompt_continuation': lambda w, ln, sw: '>' * (w - 1) + ' ',
-                'completer': PromptCompleter(),
-                'multiline': True,
-            }
-            program = prompt.prompt(u'-> ', **prompt_args).strip()
-        except (KeyboardInterrupt, EOFError):
-            print()
-            break
-
-        if not program:
-            continue
-
-        # Parameter access and changes
-        if program.startswith('.'):
-            if len(program) > 1:
-                set_param(*program[1:].split(' ', 1))
-            pprint.pprint(params)
-            continue
-
-        # Execute from file
-        if program.startswith('!'):
-            filename = program[1:].strip()
-            try:
-                with open(filename) as f:
-                    program = f.read()
-            except Exception:
-                print('Cannot read program from {0}!'.format(filename))
-                continue
-            print('Executing program from {0}:'.format(filename))
-            print(program)
-        exec_params = process_params(**params)
-        output = params.get('output') or 'live'
-
-        try:
-            if output == 'live':
-                live.stream(flow, tz, program, **exec_params)
-            elif output in ['csv', 'graph']:
-                data = csvflow.stream(flow, program, **exec_params)
-                if output == 'csv':
-                    for line in data:
-                        print(line)
-                elif output == 'graph':
-                    graph.render(data, tz)
-            else:
-                print('Unknown output format {0}!'.format(output))
-        except signalfx.signalflow.errors.ComputationAborted as e:
-            print(e)
-        except signalfx.signalflow.errors.ComputationFailed as e:
-            print(e)
-
-    return 0
-
-
 def main():
     parser = argparse.ArgumentParser(description=(
         'SignalFlow Analytics interactive command-line client (v{})'
@@ -238,14 +131,221 @@ def main():
                         help='maximum data wait (default: auto)')
     parser.add_argument('-i', '--immediate', action='store_true',
                         help='immediate results by automatic max delay offset')
-    parser.add_argument('--output', choices=['live', 'csv', 'graph'],
+    parser.add_argument('--shards', metavar='N', type=int, default=1,
+                        help='split computations with a fixed stop and '
+                             'resolution into N time windows executed in '
+                             'parallel (default: 1)')
+    parser.add_argument('--cache', action='store_true',
+                        help='cache the results of computations entirely in '
+                             'the past, and replay them from the cache')
+    parser.add_argument('--cache-dir', metavar='DIR',
+                        default=cache._DEFAULT_DIRECTORY,
+                        help='cache directory (default: {0})'
+                             .format(cache._DEFAULT_DIRECTORY))
+    parser.add_argument('--cache-size', metavar='MB', type=int, default=1024,
+                        help='maximum size of the cache (default: 1024)')
+    parser.add_argument('--cache-max-age', metavar='AGE', default='7d',
+                        help='maximum age of cached results (default: 7d)')
+    parser.add_argument('--record', metavar='FILE', default=None,
+                        help='record the message stream of the computation '
+                             'to FILE')
+    parser.add_argument('--replay', metavar='FILE', default=None,
+                        help='replay a recorded message stream from FILE '
+                             'instead of executing a program')
+    parser.add_argument('--realtime', action='store_true',
+                        help='replay messages at the pace they were '
+                             'recorded at (default: as fast as possible)')
+    parser.add_argument('--output',
+                        choices=['live', 'csv', 'graph', 'events'] +
+                        columnar.FORMATS,
                         default='live',
                         help='default output format')
+    parser.add_argument('--output-file', metavar='FILE', default=None,
+                        help='write csv or events output to FILE (default: '
+                             'stdout); required for parquet and arrow output')
+    parser.add_argument('--events-format', choices=events.FORMATS,
+                        default='jsonl',
+                        help='format of the events output: one JSON object '
+                             'per line, or csv (default: jsonl)')
+    parser.add_argument('--compression', choices=sink.COMPRESSIONS,
+                        default=None,
+                        help='compress csv output, or the columns of parquet '
+                             'and arrow output (default: from the extension '
+                             'of --output-file)')
+    parser.add_argument('--compression-level', metavar='LEVEL', type=int,
+                        default=None,
+                        help='compression level (default: the compression '
+                             'format\'s default)')
+    parser.add_argument('--rotate-size', metavar='MB', type=float,
+                        default=None,
+                        help='continue output in a new file once the current '
+                             'one grows over MB megabytes')
+    parser.add_argument('--rotate-interval', metavar='DURATION', default=None,
+                        help='continue output in a new file every DURATION '
+                             '(e.g. 1h)')
+    parser.add_argument('--csv-layout', choices=csvflow.LAYOUTS,
+                        default='wide',
+                        help='csv output layout: one column per time series, '
+                             'or one (timestamp, time series, value) row per '
+                             'value (default: wide)')
+    parser.add_argument('--metadata-file', metavar='FILE', default=None,
+                        help='with the long csv layout, write the metadata of '
+                             'each time series to FILE, as JSON lines')
+    parser.add_argument('--flush-interval', metavar='SECONDS', type=float,
+                        default=1.0,
+                        help='maximum time csv output stays buffered before '
+                             'being flushed (default: 1.0)')
+    parser.add_argument('--resume', action='store_true',
+                        help='checkpoint the progress of csv output to '
+                             '--output-file, and resume it from its '
+                             'checkpoint, if any, rather than starting over')
+    parser.add_argument('--retries', metavar='N', type=int, default=5,
+                        help='with --resume, number of times in a row a '
+                             'computation failing with a transient error is '
+                             'resumed (default: 5)')
+    parser.add_argument('--row-group-size', metavar='ROWS', type=int,
+                        default=10000,
+                        help='rows per parquet row group or arrow record '
+                             'batch (default: 10000)')
+    parser.add_argument('--max-fps', metavar='FPS', type=float, default=10,
+                        help='maximum live display and streaming graph '
+                             'refresh rate (default: 10)')
+    parser.add_argument('--select', metavar='SPEC', default=None,
+                        help='only display the time series selected by SPEC '
+                             'in the live display, for example "top 10", '
+                             '"bottom 5 rate" or "above 90 top 20"')
+    parser.add_argument('--filter', metavar='SPEC', default=None,
+                        help='only output the time series whose dimensions '
+                             'match SPEC, for example "host:web-* '
+                             '!az:us-east-1a", in the live and csv outputs')
+    parser.add_argument('--groupby', metavar='SPEC', default=None,
+                        help='aggregate the time series by the given '
+                             'dimensions in the live and csv outputs, for '
+                             'example "az" or "az,region mean" '
+                             '(default aggregation: sum)')
+    parser.add_argument('--graph-window', metavar='POINTS', type=int,
+                        default=1000,
+                        help='number of most recent datapoints shown by '
+                             'graphs of computations with no fixed stop '
+                             '(default: 1000)')
+    parser.add_argument('--stats', action='store_true',
+                        help='display statistics about the message stream '
+                             'of computations once they end')
+    parser.add_argument('--stats-file', metavar='FILE', default=None,
+                        help='also append stream statistics to FILE as '
+                             'JSON lines (implies --stats)')
+    parser.add_argument('--queue-size', metavar='N', type=int,
+                        default=buffered._DEFAULT_SIZE,
+                        help='read computation streams ahead into a queue '
+                             'of up to N messages, or 0 to read them only '
+                             'as they are output; also bounds how far '
+                             'each of --shards reads ahead (default: {0})'
+                             .format(buffered._DEFAULT_SIZE))
+    parser.add_argument('--queue-policy', choices=buffered.POLICIES,
+                        default='block',
+                        help='when the queue is full, wait for the output, '
+                             'drop the oldest data, or coalesce data to the '
+                             'latest value of each time series '
+                             '(default: block)')
+    parser.add_argument('--keepalive-interval', metavar='SECONDS', type=float,
+                        default=600,
+                        help='in interactive mode, interval at which the '
+                             'connection is checked in the background while '
+                             'idle, or 0 to only connect on demand '
+                             '(default: 600)')
+    parser.add_argument('--batch', metavar='PATH', default=None,
+                        help='execute all programs from a directory, or '
+                             'listed in a manifest file, concurrently')
+    parser.add_argument('--output-dir', metavar='DIR', default='.',
+                        help='directory to write batch outputs to '
+                             '(default: current directory)')
+    parser.add_argument('--parallelism', metavar='N', type=int, default=8,
+                        help='maximum number of concurrent batch executions '
+                             '(default: 8)')
+    parser.add_argument('--panels', metavar='PATH', default=None,
+                        help='execute all programs from a directory, or '
+                             'listed in a manifest file, and display their '
+                             'live output side by side')
     parser.add_argument('program', nargs='?', type=argparse.FileType('r'),
                         default=sys.stdin,
                         help='file to read program from (default: stdin)')
     TimezoneAction.add_to_parser(parser)
     options = parser.parse_args()
+    if options.output in columnar.FORMATS and not options.output_file:
+        parser.error('--output-file is required for {0} output'
+                     .format(options.output))
+    if options.metadata_file and options.csv_layout != 'long':
+        parser.error('--metadata-file requires the long csv layout')
+    if options.output in ['live', 'graph'] and (
+            options.compression or options.compression_level is not None or
+            options.rotate_size or options.rotate_interval):
+        parser.error('compression and rotation are not supported with {0} '
+                     'output'.format(options.output))
+    if (options.rotate_size or options.rotate_interval) and \
+            not options.output_file and not options.batch:
+        parser.error('rotation requires --output-file')
+    if not options.compression and options.output in ['csv', 'events']:
+        options.compression = sink.guess_compression(options.output_file)
+    if options.compression == 'gzip' and options.output == 'arrow':
+        parser.error('arrow output does not support gzip compression')
+    if options.compression == 'zstd' and options.output in ['csv', 'events']:
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            parser.error('zstd compression of {0} output requires the '
+                         'zstandard package'.format(options.output))
+    if options.resume:
+        if options.output != 'csv' or not options.output_file or \
+                options.output_file == '-':
+            parser.error('--resume requires csv output to --output-file')
+        if options.compression or options.rotate_size or \
+                options.rotate_interval:
+            parser.error('--resume is not supported with compression or '
+                         'rotation')
+        if options.metadata_file:
+            parser.error('--resume is not supported with --metadata-file')
+        if options.batch or options.panels:
+            parser.error('--resume is not supported with --batch or '
+                         '--panels')
+    rotate_size = int(options.rotate_size * (1 << 20)) \
+        if options.rotate_size else None
+    rotate_interval = tslib.parse_to_timestamp('={0}'.format(
+        options.rotate_interval)) / 1000.0 if options.rotate_interval \
+        else None
+    if options.batch:
+        from . import batch
+        if options.output not in batch.FORMATS:
+            parser.error('batch mode requires one of the {0} outputs'
+                         .format(', '.join(batch.FORMATS)))
+        if options.record:
+            parser.error('--record is not supported in batch mode')
+        if options.stats or options.stats_file:
+            parser.error('--stats is not supported in batch mode')
+    if options.panels:
+        if options.batch:
+            parser.error('--panels and --batch are mutually exclusive')
+        if options.record:
+            parser.error('--record is not supported with --panels')
+        if options.stats or options.stats_file:
+            parser.error('--stats is not supported with --panels')
+    if options.queue_size < 0:
+        parser.error('--queue-size must be 0 or more')
+    options.stats = options.stats or bool(options.stats_file)
+    select = None
+    if options.select:
+        from . import selection
+        try:
+            select = selection.parse(options.select)
+        except ValueError as e:
+            parser.error(str(e))
+    view = None
+    if options.filter or options.groupby:
+        from . import dimensions
+        try:
+            view = dimensions.View(dimensions.parse_filter(options.filter),
+                                   dimensions.parse_grouping(options.groupby))
+        except ValueError as e:
+            parser.error(str(e))
 
     params = {
         'start': options.start,
@@ -254,32 +354,168 @@ def main():
         'max_delay': options.max_delay,
         'output': options.output,
         'immediate': options.immediate,
+        'select': options.select,
+        'filter': options.filter,
+        'groupby': options.groupby,
     }
 
-    # Ensure that we have a session token.
-    token = find_session_token(options)
-    if not token:
-        sys.stderr.write('No authentication token found.\n')
-        return 1
+    interactive = sys.stdin.isatty() and not options.execute and \
+        not options.replay and not options.batch and not options.panels
+
+    if options.replay or options.record:
+        from . import recording
+    if options.replay:
+        flow = recording.ReplayFlow(options.replay, options.realtime)
+    else:
+        # Ensure that we have a session token.
+        token = find_session_token(options)
+        if not token:
+            sys.stderr.write('No authentication token found.\n')
+            return 1
+
+        flow = signalfx.SignalFx(
+            api_endpoint=options.api_endpoint,
+            stream_endpoint=options.stream_endpoint).signalflow(token)
+        if interactive:
+            # Connect while the user types their first program.
+            from . import keepalive
+            flow = keepalive.KeepAliveFlow(flow, options.keepalive_interval)
+        if options.shards > 1:
+            from . import shard
+            flow = shard.ShardedFlow(flow, options.shards,
+                                     max(options.queue_size, 1))
+        if options.cache:
+            max_age = tslib.parse_to_timestamp('={0}'.format(
+                options.cache_max_age)) // 1000
+            flow = cache.CachingFlow(flow, cache.ResultCache(
+                options.cache_dir, max_size=options.cache_size << 20,
+                max_age=max_age))
+    if options.record:
+        flow = recording.RecordingFlow(flow, options.record)
+    if options.queue_size:
+        flow = buffered.BufferedFlow(flow, options.queue_size,
+                                     options.queue_policy)
 
-    flow = signalfx.SignalFx(
-        api_endpoint=options.api_endpoint,
-        stream_endpoint=options.stream_endpoint).signalflow(token)
     try:
-        if sys.stdin.isatty() and not options.execute:
-            prompt(flow, options.timezone, params)
+        if options.batch:
+            params = process_params(**params)
+            failures = batch.run(flow, options.batch, options.output_dir,
+                                 options.output, params,
+                                 parallelism=options.parallelism,
+                                 row_group_size=options.row_group_size,
+                                 csv_layout=options.csv_layout,
+                                 compression=options.compression,
+                                 compression_level=options.compression_level,
+                                 rotate_size=rotate_size,
+                                 rotate_interval=rotate_interval,
+                                 view=view)
+            return 1 if failures else 0
+        elif options.panels:
+            from . import multi
+            programs = []
+            for path, overrides in multi.panels(options.panels):
+                with open(path) as f:
+                    title = ' '.join([os.path.basename(path)] + [
+                        '{0}={1}'.format(k, v)
+                        for k, v in sorted(overrides.items())])
+                    programs.append((
+                        title, f.read(),
+                        process_params(**dict(params, **overrides))))
+            multi.stream(flow, options.timezone, programs,
+                         max_fps=options.max_fps, selection=select,
+                         view=view)
+        elif interactive:
+            from . import repl
+            repl.prompt(flow, options.timezone, params, options.max_fps,
+                        options.stats, options.stats_file,
+                        options.graph_window)
         else:
-            program = options.program.read()
+            program = options.program.read() if not options.replay else ''
+
             params = process_params(**params)
-            if options.output == 'live':
-                live.stream(flow, options.timezone, program, **params)
-            else:
-                data = csvflow.stream(flow, program, **params)
-                if options.output == 'csv':
-                    for line in data:
-                        print(line)
+            stream_stats = None
+            if options.stats:
+                from . import stats
+                stream_stats = stats.StreamStats()
+            try:
+                if options.output == 'live':
+                    from . import live
+                    live.stream(flow, options.timezone, program,
+                                max_fps=options.max_fps, stats=stream_stats,
+                                selection=select, view=view, **params)
+                elif options.output == 'csv':
+                    checkpoint = None
+                    if options.resume:
+                        from . import resume
+                        try:
+                            checkpoint = resume.open_checkpoint(
+                                options.output_file, resume.digest(
+                                    program, layout=options.csv_layout,
+                                    filter=options.filter,
+                                    groupby=options.groupby), params)
+                        except ValueError as e:
+                            parser.error(str(e))
+                        if checkpoint.complete:
+                            return 0
+                        flow = resume.ResumableFlow(
+                            flow, checkpoint.timestamp, options.retries)
+                    metadata = sink.open_sink(
+                        options.metadata_file, options.flush_interval,
+                        compression=sink.guess_compression(
+                            options.metadata_file)) \
+                        if options.metadata_file else None
+                    try:
+                        with sink.open_sink(
+                                options.output_file, options.flush_interval,
+                                compression=options.compression,
+                                compression_level=options.compression_level,
+                                rotate_size=rotate_size,
+                                rotate_interval=rotate_interval,
+                                append=checkpoint is not None and
+                                checkpoint.timestamp is not None) as out:
+                            if checkpoint:
+                                checkpoint.out = out
+                            csvflow.write(out, flow, program,
+                                          stats=stream_stats,
+                                          layout=options.csv_layout,
+                                          metadata=metadata, view=view,
+                                          checkpoint=checkpoint, **params)
+                    finally:
+                        if metadata:
+                            metadata.close()
+                elif options.output == 'events':
+                    with sink.open_sink(
+                            options.output_file, options.flush_interval,
+                            compression=options.compression,
+                            compression_level=options.compression_level,
+                            rotate_size=rotate_size,
+                            rotate_interval=rotate_interval) as out:
+                        events.write(out, flow, program, stats=stream_stats,
+                                     fmt=options.events_format, **params)
+                elif options.output == 'graph' and not params['stop']:
+                    from . import graph
+                    graph.stream(flow, options.timezone, program,
+                                 window=options.graph_window,
+                                 max_fps=options.max_fps, stats=stream_stats,
+                                 **params)
                 elif options.output == 'graph':
+                    from . import graph
+                    data = csvflow.frame(flow, program, stats=stream_stats,
+                                         **params)
                     graph.render(data, options.timezone)
+                elif options.output in columnar.FORMATS:
+                    columnar.write(options.output_file, flow, program,
+                                   fmt=options.output,
+                                   row_group_size=options.row_group_size,
+                                   stats=stream_stats,
+                                   compression=options.compression,
+                                   compression_level=options.compression_level,
+                                   rotate_size=rotate_size,
+                                   rotate_interval=rotate_interval,
+                                   view=view, **params)
+            finally:
+                if stream_stats:
+                    stream_stats.write(options.stats_file)
     finally:
         flow.close()
 
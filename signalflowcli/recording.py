@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2018 SignalFx, Inc. All Rights Reserved.
+
+"""Compact recordings of computation message streams.
+
+A recording is a gzip-compressed sequence of length-prefixed records, each
+record being a JSON-encoded list whose first element identifies the type of
+message it holds, and second element is the time the message was received
+at, in milliseconds since the start of the recording."""
+
+import gzip
+import json
+from signalfx import signalflow
+import struct
+import time
+
+_FORMAT = 'signalflow-cli-recording'
+_VERSION = 2
+
+_LENGTH = struct.Struct('>I')
+
+
+def _encode(message):
+    """Return the record for the given message, or None if it isn't a type
+    of message that gets recorded."""
+    m = signalflow.messages
+    if isinstance(message, m.DataMessage):
+        return ['D', message.logical_timestamp_ms, message.data]
+    if isinstance(message, m.MetadataMessage):
+        return ['M', message.tsid, message.properties]
+    if isinstance(message, m.EventMessage):
+        return ['E', message.tsid, message.timestamp_ms, message.metadata,
+                message.properties]
+    if isinstance(message, m.ExpiredTsIdMessage):
+        return ['X', message.tsid]
+    if isinstance(message, m.JobStartMessage):
+        return ['J', message.timestamp_ms, message.handle]
+    if isinstance(message, m.JobProgressMessage):
+        return ['P', message.timestamp_ms, message.progress]
+    if isinstance(message, m.InfoMessage):
+        return ['I', message.logical_timestamp_ms, message.message]
+    return None
+
+
+def _decode(record):
+    """Return the message held by the given record."""
+    m = signalflow.messages
+    kind, args = record[0], record[1:]
+    if kind == 'D':
+        return m.DataMessage(args[0], [{'tsId': tsid, 'value': value}
+                                       for tsid, value in args[1].items()])
+    if kind == 'M':
+        return m.MetadataMessage(*args)
+    if kind == 'E':
+        return m.EventMessage(*args)
+    if kind == 'X':
+        return m.ExpiredTsIdMessage(*args)
+    if kind == 'J':
+        return m.JobStartMessage(*args)
+    if kind == 'P':
+        return m.JobProgressMessage(*args)
+    if kind == 'I':
+        return m.InfoMessage(*args)
+    raise ValueError('Unknown record type {0}'.format(kind))
+
+
+class Writer(object):
+    """Writes computation messages to a recording file."""
+
+    def __init__(self, path):
+        self._f = gzip.open(path, 'wb')
+        self._write([_FORMAT, _VERSION])
+        self._started = time.time()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _write(self, record):
+        data = json.dumps(record, separators=(',', ':')).encode('utf-8')
+        self._f.write(_LENGTH.pack(len(data)))
+        self._f.write(data)
+
+    def write(self, message):
+        record = _encode(message)
+        if record:
+            elapsed = int((time.time() - self._started) * 1000)
+            self._write(record[:1] + [elapsed] + record[1:])
+
+    def close(self):
+        self._f.close()
+
+
+def records(path):
+    """Generate (elapsed, message) tuples from the given recording file,
+    elapsed being the time the message was received at, in milliseconds
+    since the start of the recording."""
+    with gzip.open(path, 'rb') as f:
+        def _records():
+            while True:
+                length = f.read(_LENGTH.size)
+                if len(length) < _LENGTH.size:
+                    return
+                yield json.loads(f.read(_LENGTH.unpack(length)[0])
+                                 .decode('utf-8'))
+
+        it = _records()
+        header = next(it, None)
+        if not header or header[0] != _FORMAT or header[1] != _VERSION:
+            raise ValueError('{0} is not a supported recording'.format(path))
+        for record in it:
+            yield record[1], _decode(record[:1] + record[2:])
+
+
+class ReplayComputation(object):
+    """A computation whose messages are read back from a recording, tracking
+    metadata, resolution and logical time like a live computation does.
+
+    Messages are replayed as fast as possible, or, if realtime is set, at
+    the pace they were originally received at."""
+
+    def __init__(self, path, realtime=False):
+        self._path = path
+        self._realtime = realtime
+        self._metadata = {}
+        self._resolution = None
+        self._last_logical_ts = None
+        self._stream = None
+
+    @property
+    def resolution(self):
+        return self._resolution
+
+    @property
+    def last_logical_ts(self):
+        return self._last_logical_ts
+
+    def get_known_tsids(self):
+        return sorted(self._metadata.keys())
+
+    def get_metadata(self, tsid):
+        return self._metadata.get(tsid)
+
+    def close(self):
+        if self._stream:
+            self._stream.close()
+            self._stream = None
+
+    def stream(self):
+        m = signalflow.messages
+        self._stream = records(self._path)
+        started = time.time()
+        for elapsed, message in self._stream:
+            if self._realtime:
+                delay = started + elapsed / 1000.0 - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+
+            if isinstance(message, m.MetadataMessage):
+                self._metadata[message.tsid] = message.properties
+            elif isinstance(message, m.ExpiredTsIdMessage):
+                self._metadata.pop(message.tsid, None)
+            elif isinstance(message, m.InfoMessage):
+                if message.message.get('messageCode') == \
+                        'JOB_RUNNING_RESOLUTION':
+                    self._resolution = \
+                        message.message['contents']['resolutionMs']
+            elif isinstance(message, m.DataMessage):
+                self._last_logical_ts = message.logical_timestamp_ms
+            yield message
+
+
+class RecordingComputation(object):
+    """Wraps a computation to record the messages it streams to a file.
+
+    Once the recording is closed, the optional on_close callback is called
+    with the path of the recording and whether the computation's stream ran
+    to completion."""
+
+    def __init__(self, computation, path, on_close=None):
+        self._computation = computation
+        self._path = path
+        self._on_close = on_close
+
+    def __getattr__(self, name):
+        return getattr(self._computation, name)
+
+    def stream(self):
+        complete = False
+        try:
+            with Writer(self._path) as writer:
+                for message in self._computation.stream():
+                    writer.write(message)
+                    yield message
+            complete = True
+        finally:
+            if self._on_close:
+                self._on_close(self._path, complete)
+
+
+class RecordingFlow(object):
+    """Wraps a SignalFlow client to record the message stream of the
+    computations it executes to the given file. Each computation overwrites
+    the recording of the previous one."""
+
+    def __init__(self, flow, path):
+        self._flow = flow
+        self._path = path
+
+    def execute(self, program, **kwargs):
+        return RecordingComputation(self._flow.execute(program, **kwargs),
+                                    self._path)
+
+    def close(self):
+        self._flow.close()
+
+
+class ReplayFlow(object):
+    """A stand-in for a SignalFlow client that replays a recording in place
+    of executing computations. The program and computation parameters are
+    ignored."""
+
+    def __init__(self, path, realtime=False):
+        self._path = path
+        self._realtime = realtime
+
+    def execute(self, program, **kwargs):
+        return ReplayComputation(self._path, self._realtime)
+
+    def close(self):
+        pass
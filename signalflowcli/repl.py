@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2018 SignalFx, Inc. All Rights Reserved.
+
+"""The interactive SignalFlow prompt.
+
+This module, and the prompt_toolkit machinery it depends on, are only
+imported when the CLI runs interactively."""
+
+from ansicolor import red, white
+import os
+import pprint
+import prompt_toolkit
+import pygments_signalflow
+import signalfx
+
+from . import dimensions, selection, stats
+from .prompt import _DISPLAY_PARAMS, process_params
+
+
+class OptionCompleter(prompt_toolkit.completion.Completer):
+
+    OPTS = ['start', 'stop', 'resolution', 'max_delay', 'output', 'immediate',
+            'select', 'filter', 'groupby']
+
+    def get_completions(self, document, complete_event):
+        for opt in self.OPTS:
+            if opt.startswith(document.text_before_cursor):
+                yield prompt_toolkit.completion.Completion(
+                        opt, start_position=-document.cursor_position)
+
+
+class PromptCompleter(prompt_toolkit.completion.Completer):
+
+    fs_completer = prompt_toolkit.completion.filesystem.PathCompleter()
+    opt_completer = OptionCompleter()
+
+    def _offset(self, document, offset=1):
+        return prompt_toolkit.document.Document(
+                document.text[offset:], document.cursor_position - offset)
+
+    def get_completions(self, document, complete_event):
+        if document.text.startswith('!'):
+            return self.fs_completer.get_completions(
+                    self._offset(document), complete_event)
+        elif document.text.startswith('.'):
+            return self.opt_completer.get_completions(
+                    self._offset(document), complete_event)
+        return []
+
+
+def _display(params):
+    """Parse the display parameters into a selection.Selection and a
+    dimensions.View. Raises ValueError for invalid parameters."""
+    return (selection.parse(params.get('select')),
+            dimensions.View(dimensions.parse_filter(params.get('filter')),
+                            dimensions.parse_grouping(params.get('groupby'))))
+
+
+def prompt(flow, tz, params, max_fps=10, show_stats=False, stats_file=None,
+           graph_window=1000):
+    print(red('-*-', bold=True) + ' ' +
+          white('SignalFx SignalFlow™ Analytics Console', bold=True) + ' ' +
+          red('-*-', bold=True))
+    print()
+    print(white('Enter your program and press <Esc><Enter> to execute.'))
+    print('SignalFlow programs may span multiple lines.')
+    print('Set parameters with ".<param> <value>"; '
+          'see current settings with "."')
+    print('To stop streaming, or to exit, just press ^C.')
+    print()
+
+    def set_param(param, value=None):
+        if param not in params:
+            print('Unknown parameter {0} !'.format(param))
+            return
+        params[param] = value
+
+    # The display of the last live output, which display parameter changes
+    # apply to immediately, from the data it received.
+    last = None
+
+    history = prompt_toolkit.history.FileHistory(
+            os.path.expanduser('~/.signalflow.history'))
+    prompt = prompt_toolkit.shortcuts.PromptSession(history=history)
+
+    while True:
+        program = []
+        try:
+            prompt_args = {
+                'lexer': prompt_toolkit.lexers.PygmentsLexer(
+                    pygments_signalflow.SignalFlowLexer),
+                'auto_suggest':
+                    prompt_toolkit.auto_suggest.AutoSuggestFromHistory(),
+                'prompt_continuation': lambda w, ln, sw: '>' * (w - 1) + ' ',
+                'completer': PromptCompleter(),
+                'multiline': True,
+            }
+            program = prompt.prompt(u'-> ', **prompt_args).strip()
+        except (KeyboardInterrupt, EOFError):
+            print()
+            break
+
+        if not program:
+            continue
+
+        # Parameter access and changes
+        if program.startswith('.'):
+            if len(program) > 1:
+                param = program[1:].split(' ', 1)
+                set_param(*param)
+                if last and param[0] in _DISPLAY_PARAMS:
+                    try:
+                        select, view = _display(params)
+                        last.set_view(select, view.filter, view.grouping)
+                        print('\n'.join(last.render()))
+                    except ValueError as e:
+                        print(e)
+                    continue
+            pprint.pprint(params)
+            continue
+
+        # Execute from file
+        if program.startswith('!'):
+            filename = program[1:].strip()
+            try:
+                with open(filename) as f:
+                    program = f.read()
+            except Exception:
+                print('Cannot read program from {0}!'.format(filename))
+                continue
+            print('Executing program from {0}:'.format(filename))
+            print(program)
+        exec_params = process_params(**params)
+        output = params.get('output') or 'live'
+        try:
+            select, view = _display(params)
+        except ValueError as e:
+            print(e)
+            continue
+
+        stream_stats = None
+        if show_stats:
+            stream_stats = stats.StreamStats()
+        try:
+            if output == 'live':
+                from . import live
+                last = live.stream(flow, tz, program, max_fps=max_fps,
+                                   stats=stream_stats, selection=select,
+                                   view=view, **exec_params)
+            elif output in ['csv', 'graph']:
+                from . import csvflow
+                if output == 'csv':
+                    from . import sink
+                    with sink.open_sink() as out:
+                        csvflow.write(out, flow, program, stats=stream_stats,
+                                      view=view, **exec_params)
+                elif output == 'graph' and not exec_params['stop']:
+                    from . import graph
+                    graph.stream(flow, tz, program, window=graph_window,
+                                 max_fps=max_fps, stats=stream_stats,
+                                 **exec_params)
+                elif output == 'graph':
+                    from . import graph
+                    data = csvflow.frame(flow, program, stats=stream_stats,
+                                         **exec_params)
+                    graph.render(data, tz)
+            elif output == 'events':
+                from . import events, sink
+                with sink.open_sink() as out:
+                    events.write(out, flow, program, stats=stream_stats,
+                                 **exec_params)
+            else:
+                print('Unknown output format {0}!'.format(output))
+                stream_stats = None
+        except signalfx.signalflow.errors.ComputationAborted as e:
+            print(e)
+        except signalfx.signalflow.errors.ComputationFailed as e:
+            print(e)
+        finally:
+            if stream_stats:
+                stream_stats.write(stats_file)
+
+    return 0
@@ -0,0 +1,313 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2018 SignalFx, Inc. All Rights Reserved.
+
+"""Checkpoints of long-running exports, from which they can be resumed once
+interrupted, and retries of their computations on transient errors."""
+
+import hashlib
+import json
+import os
+from signalfx import signalflow
+import socket
+import sys
+import tempfile
+import time
+
+from . import utils
+
+_SUFFIX = '.checkpoint'
+
+# Default maximum number of consecutive retries of a failing computation.
+_DEFAULT_RETRIES = 5
+
+# Delay before the first retry, doubled for each consecutive retry, and
+# maximum delay between retries, in seconds.
+_BACKOFF = 1
+_MAX_BACKOFF = 60
+
+# Minimum interval between checkpoints, in seconds.
+_DEFAULT_INTERVAL = 5
+
+
+def _message(msg):
+    utils.message(msg, out=sys.stderr)
+
+
+def sidecar_path(path):
+    """Return the path of the checkpoint of the output file at the given
+    path."""
+    return path + _SUFFIX
+
+
+def digest(program, **options):
+    """Return the digest of the given program and output options, which a
+    checkpoint must match for an export to be resumed from it."""
+    data = json.dumps([program, options], sort_keys=True)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def is_transient(e):
+    """Return whether the given error, raised while executing or streaming a
+    computation, is worth retrying: failures of the computation, and
+    connection errors, but not errors of the request itself (like an
+    invalid program or token)."""
+    if isinstance(e, signalflow.errors.ComputationFailed):
+        return True
+    if isinstance(e, signalflow.errors.SignalFlowException):
+        return not (isinstance(e.code, int) and 400 <= e.code < 500)
+    return isinstance(e, (socket.error, IOError))
+
+
+class Checkpoint(object):
+    """The progress of an export, saved to a sidecar file next to its
+    output: the logical timestamp of the last data message whose rows were
+    written, the size of the output at that point, the columns of the
+    output (as (key, name) pairs, see csvflow.Schema), and the parameters
+    of the computation.
+
+    Checkpoints are saved at most every interval seconds, after flushing the
+    output, so that the output always holds at least the rows the
+    checkpoint accounts for. Rows written after the last checkpoint are
+    truncated away when resuming.
+
+    :param path: The path of the checkpoint file.
+    :param digest: The digest of the program and output options (see
+        digest()).
+    :param start: The start timestamp of the computation.
+    :param stop: The stop timestamp of the computation, or None.
+    :param resolution: The resolution of the computation, or None if it's
+        not known yet.
+    """
+
+    def __init__(self, path, digest, start=None, stop=None,
+                 resolution=None, interval=_DEFAULT_INTERVAL):
+        self.path = path
+        self.digest = digest
+        self.start = start
+        self.stop = stop
+        self.resolution = resolution
+        self.timestamp = None
+        self.size = 0
+        self.columns = None
+        self.complete = False
+        self.out = None
+        self._schema = None
+        self._interval = interval
+        self._saved = time.time()
+
+    @staticmethod
+    def load(path):
+        """Load the checkpoint saved at the given path. Returns None if
+        there is none.
+
+        Raises ValueError for invalid checkpoint files."""
+        try:
+            with open(path) as f:
+                state = json.load(f)
+            checkpoint = Checkpoint(path, state['digest'], state['start'],
+                                    state['stop'], state['resolution'])
+            checkpoint.timestamp = state['timestamp']
+            checkpoint.size = state['size']
+            checkpoint.columns = state['columns']
+            checkpoint.complete = state['complete']
+            return checkpoint
+        except (IOError, OSError):
+            if os.path.exists(path):
+                raise
+            return None
+        except (KeyError, TypeError, ValueError):
+            raise ValueError('Invalid checkpoint {0}.'.format(path))
+
+    def truncate(self, path):
+        """Truncate the output file at the given path to the size it had
+        when the checkpoint was saved, dropping any row written after."""
+        with open(path, 'r+b') as f:
+            f.truncate(self.size)
+
+    def update(self, schema, timestamp, resolution):
+        """Record that the rows of the data message with the given logical
+        timestamp were written to the output, with the given schema, and
+        save the checkpoint if the interval has elapsed."""
+        self.timestamp = timestamp
+        self.resolution = resolution
+        self._schema = schema
+        if time.time() - self._saved >= self._interval:
+            self.save()
+
+    def save(self, complete=False):
+        """Flush the output and save the checkpoint, atomically replacing
+        the previous one."""
+        if self._schema is not None:
+            self.columns = list(zip(self._schema.tsids, self._schema.names))
+        if self.out is not None:
+            self.out.flush()
+            self.size = self.out.size
+        self.complete = complete
+
+        fd, tmp = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(self.path)), suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump({
+                'digest': self.digest,
+                'start': self.start,
+                'stop': self.stop,
+                'resolution': self.resolution,
+                'timestamp': self.timestamp,
+                'size': self.size,
+                'columns': self.columns,
+                'complete': self.complete,
+            }, f, sort_keys=True)
+        os.rename(tmp, self.path)
+        self._saved = time.time()
+
+
+def open_checkpoint(path, digest, params):
+    """Open the checkpoint of the export to the output file at the given
+    path. If it has one for the same program and options (see digest()),
+    the export is resumed from it: the output is truncated to the rows it
+    accounts for, and the given computation parameters are updated to those
+    of the export. Otherwise, a new checkpoint is started.
+
+    Raises ValueError if the export can't be resumed from its checkpoint.
+    """
+    sidecar = sidecar_path(path)
+    checkpoint = Checkpoint.load(sidecar)
+    if checkpoint and checkpoint.digest != digest:
+        raise ValueError('{0} is the checkpoint of another program or output '
+                         'options; remove it to start over.'.format(sidecar))
+    if not checkpoint or checkpoint.timestamp is None:
+        return Checkpoint(sidecar, digest, params['start'], params['stop'])
+
+    if not os.path.exists(path) or os.path.getsize(path) < checkpoint.size:
+        raise ValueError('{0} is missing rows recorded in its checkpoint; '
+                         'remove {1} to start over.'.format(path, sidecar))
+    if checkpoint.complete:
+        _message('Export to {0} already complete (checkpoint {1}).\n'
+                 .format(path, sidecar))
+    else:
+        checkpoint.truncate(path)
+        _message('Resuming export after {0} (checkpoint {1}).\n'.format(
+            checkpoint.timestamp, sidecar))
+    params.update(start=checkpoint.start, stop=checkpoint.stop,
+                  resolution=checkpoint.resolution)
+    return checkpoint
+
+
+class ResumableFlow(object):
+    """Wraps a SignalFlow client so that computations resume after the last
+    data message they output, rather than starting over, when their
+    execution fails with a transient error (see is_transient()). They are
+    retried up to retries times in a row, with an exponential backoff.
+
+    :param after: The logical timestamp after which computations start, to
+        resume an export from its checkpoint, or None.
+    """
+
+    def __init__(self, flow, after=None, retries=_DEFAULT_RETRIES):
+        self._flow = flow
+        self._after = after
+        self._retries = retries
+
+    def execute(self, program, **kwargs):
+        return ResumableComputation(self._flow, program, kwargs, self._after,
+                                    self._retries)
+
+    def close(self):
+        self._flow.close()
+
+
+class ResumableComputation(object):
+    """A computation resumed after the last data message it output when it
+    fails, skipping the data messages it already output. See
+    ResumableFlow."""
+
+    def __init__(self, flow, program, params, after, retries):
+        self._flow = flow
+        self._program = program
+        self._params = params
+        self._after = after
+        self._retries = retries
+        self._attempts = 0
+        self._metadata = {}
+        self._computation = None
+        if not self._done():
+            self._execute()
+
+    def __getattr__(self, name):
+        return getattr(self._computation, name)
+
+    def _done(self):
+        stop = self._params.get('stop')
+        return self._after is not None and stop is not None and \
+            self._after + 1 >= stop
+
+    def _execute(self):
+        while True:
+            params = dict(self._params)
+            if self._after is not None:
+                params['start'] = self._after + 1
+            try:
+                self._computation = self._flow.execute(self._program,
+                                                       **params)
+                return
+            except Exception as e:
+                if not self._retry(e):
+                    raise
+
+    def _retry(self, e):
+        """Wait before retrying after the given error. Returns False,
+        without waiting, if the error isn't transient or there were too
+        many retries in a row already."""
+        if not is_transient(e) or self._attempts >= self._retries:
+            return False
+        self._attempts += 1
+        delay = min(_BACKOFF << (self._attempts - 1), _MAX_BACKOFF)
+        _message('\r\033[K{0}; retrying in {1}s ({2}/{3})...\n'.format(
+            e, delay, self._attempts, self._retries))
+        time.sleep(delay)
+        return True
+
+    def _restart(self):
+        # Keep the metadata and resolution of the failed computation, the
+        # new one only outputs the time series it sees from now on, at a
+        # resolution that may otherwise differ for the shorter time range.
+        for tsid in self._computation.get_known_tsids():
+            self._metadata[tsid] = self._computation.get_metadata(tsid)
+        if self._computation.resolution:
+            self._params['resolution'] = self._computation.resolution
+        try:
+            self._computation.close()
+        except Exception:
+            pass
+        self._execute()
+
+    def get_known_tsids(self):
+        return sorted(set(self._metadata) |
+                      set(self._computation.get_known_tsids()))
+
+    def get_metadata(self, tsid):
+        return self._computation.get_metadata(tsid) or \
+            self._metadata.get(tsid)
+
+    def stream(self):
+        while not self._done():
+            try:
+                for message in self._computation.stream():
+                    if isinstance(message, signalflow.messages.DataMessage):
+                        ts = message.logical_timestamp_ms
+                        if self._after is not None and ts <= self._after:
+                            continue
+                        self._after = ts
+                        self._attempts = 0
+                    yield message
+                return
+            except Exception as e:
+                if not self._retry(e):
+                    raise
+                self._restart()
+
+    def close(self):
+        if self._computation:
+            self._computation.close()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2018 SignalFx, Inc. All Rights Reserved.
+
+"""Selection of the time series shown by the live display, for programs
+publishing more time series than fit on a terminal."""
+
+
+class Selection(object):
+    """Criteria selecting the time series shown by the live display.
+
+    Time series are ranked by their latest value, or by their rate of change
+    (the difference between their last two values). Only those whose rank
+    is above (or below) the threshold, if any, are kept, and of those, the
+    count largest (or smallest) ones, if set.
+
+    :param count: The maximum number of time series shown, or None.
+    :param largest: Whether to keep the time series with the largest
+        (top) or smallest (bottom) ranks.
+    :param threshold: The threshold the ranks of the time series must be
+        over, or under, to be shown, or None.
+    :param above: Whether ranks must be above or below the threshold.
+    :param rate: Whether time series are ranked by rate of change rather
+        than by value.
+    """
+
+    def __init__(self, count=None, largest=True, threshold=None, above=True,
+                 rate=False):
+        self.count = count
+        self.largest = largest
+        self.threshold = threshold
+        self.above = above
+        self.rate = rate
+
+    def __str__(self):
+        parts = []
+        if self.count:
+            parts.append('{0} {1}'.format(
+                'top' if self.largest else 'bottom', self.count))
+        if self.threshold is not None:
+            parts.append('{0} {1:g}'.format(
+                'above' if self.above else 'below', self.threshold))
+        parts.append('by rate' if self.rate else 'by value')
+        return ' '.join(parts)
+
+
+def parse(spec):
+    """Parse a selection specification, made of any combination of
+    'top K' or 'bottom K', 'above X' or 'below X', and 'rate', for example
+    'top 10', 'bottom 5 rate' or 'above 90 top 20'. Returns a Selection, or
+    None if the specification is empty.
+
+    Raises ValueError for invalid specifications."""
+    if not spec or not spec.strip():
+        return None
+
+    selection = Selection()
+    tokens = spec.split()
+    while tokens:
+        token = tokens.pop(0).lower()
+        if token == 'rate':
+            selection.rate = True
+            continue
+        if token not in ['top', 'bottom', 'above', 'below'] or not tokens:
+            raise ValueError('Invalid selection {0}: expected top K, '
+                             'bottom K, above X, below X or rate.'
+                             .format(spec))
+        value = tokens.pop(0)
+        try:
+            if token in ['top', 'bottom']:
+                selection.count = int(value)
+                selection.largest = token == 'top'
+                if selection.count < 1:
+                    raise ValueError()
+            else:
+                selection.threshold = float(value)
+                selection.above = token == 'above'
+        except ValueError:
+            raise ValueError('Invalid selection {0}: invalid {1} value {2}.'
+                             .format(spec, token, value))
+    return selection
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2018 SignalFx, Inc. All Rights Reserved.
+
+from signalfx import signalflow
+from six.moves import queue
+import threading
+
+from . import buffered
+
+
+def windows(start, stop, resolution, shards):
+    """Split the [start, stop) time range into at most the given number of
+    contiguous windows, with boundaries aligned to the resolution.
+
+    Returns a list of (start, stop) tuples."""
+    boundaries = [start]
+    for i in range(1, shards):
+        b = start + (stop - start) * i // shards
+        b -= b % resolution
+        if boundaries[-1] < b < stop:
+            boundaries.append(b)
+    boundaries.append(stop)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+class ShardedFlow(object):
+    """Wraps a SignalFlow client to split the computations over a long,
+    bounded time range into several time windows executed in parallel.
+
+    Computations that have no fixed stop, or no explicit resolution to align
+    the windows to, are executed normally.
+
+    :param queue_size: The maximum number of messages each shard reads
+        ahead of the output.
+    """
+
+    def __init__(self, flow, shards, queue_size=buffered._DEFAULT_SIZE):
+        self._flow = flow
+        self._shards = shards
+        self._queue_size = queue_size
+
+    def execute(self, program, start=None, stop=None, resolution=None,
+                **kwargs):
+        if self._shards < 2 or not start or not stop or not resolution:
+            return self._flow.execute(program, start=start, stop=stop,
+                                      resolution=resolution, **kwargs)
+        return ShardedComputation(
+            self._flow, program,
+            windows(start, stop, resolution, self._shards),
+            self._queue_size, resolution=resolution, **kwargs)
+
+    def close(self):
+        self._flow.close()
+
+
+class ShardedComputation(object):
+    """A computation executed as several computations over contiguous time
+    windows, running in parallel. Their output is stitched back together in
+    timestamp order, each shard only contributing the data of its own window,
+    so that the result is the same as one computation over the whole range.
+
+    Each shard is consumed by its own thread into a bounded queue, while the
+    stream() generator drains those queues in order: shards whose queue is
+    full wait for the output to catch up, rather than buffering their whole
+    window in memory."""
+
+    _END = object()
+
+    def __init__(self, flow, program, windows,
+                 queue_size=buffered._DEFAULT_SIZE, **kwargs):
+        self._windows = windows
+        self._closed = False
+        self._metadata = {}
+        self._last_logical_ts = None
+        self._computations = []
+        try:
+            for start, stop in windows:
+                self._computations.append(
+                    flow.execute(program, start=start, stop=stop, **kwargs))
+        except Exception:
+            self.close()
+            raise
+
+        self._queues = [queue.Queue(maxsize=queue_size) for _ in windows]
+        for c, q in zip(self._computations, self._queues):
+            t = threading.Thread(target=self._consume, args=(c, q))
+            t.daemon = True
+            t.start()
+
+    def _put(self, q, item):
+        # Wait for room in steps, to stop once the computation is closed.
+        while not self._closed:
+            try:
+                q.put(item, timeout=1)
+                return
+            except queue.Full:
+                pass
+
+    def _consume(self, c, q):
+        try:
+            for message in c.stream():
+                if self._closed:
+                    return
+                self._put(q, message)
+        except Exception as e:
+            self._put(q, e)
+        finally:
+            self._put(q, ShardedComputation._END)
+
+    @property
+    def resolution(self):
+        for c in self._computations:
+            if c.resolution:
+                return c.resolution
+        return None
+
+    @property
+    def last_logical_ts(self):
+        return self._last_logical_ts
+
+    def get_known_tsids(self):
+        return sorted(self._metadata.keys())
+
+    def get_metadata(self, tsid):
+        return self._metadata.get(tsid)
+
+    def close(self):
+        self._closed = True
+        for c in self._computations:
+            c.close()
+
+    def _in_window(self, i, ts):
+        """Tell whether the given timestamp belongs to the ith window. The
+        last window also owns anything past its end."""
+        start, stop = self._windows[i]
+        if (i > 0 and ts < start) or (self._last_logical_ts is not None and
+                                      ts <= self._last_logical_ts):
+            return False
+        return i == len(self._windows) - 1 or ts < stop
+
+    def stream(self):
+        for i, q in enumerate(self._queues):
+            while True:
+                message = q.get()
+                if message is ShardedComputation._END:
+                    break
+                if isinstance(message, Exception):
+                    raise message
+
+                # Control messages are only relevant from the first shard.
+                if isinstance(message, (signalflow.messages.JobStartMessage,
+                                        signalflow.messages.JobProgressMessage,
+                                        signalflow.messages.InfoMessage)):
+                    if i == 0:
+                        yield message
+                    continue
+
+                # Expirations at the end of a window are an artifact of
+                # sharding.
+                if isinstance(message,
+                              signalflow.messages.ExpiredTsIdMessage):
+                    continue
+
+                if isinstance(message, signalflow.messages.MetadataMessage):
+                    if message.tsid not in self._metadata:
+                        self._metadata[message.tsid] = message.properties
+                        yield message
+                    continue
+
+                if isinstance(message, signalflow.messages.DataMessage):
+                    if not self._in_window(i, message.logical_timestamp_ms):
+                        continue
+                    self._last_logical_ts = message.logical_timestamp_ms
+                elif isinstance(message, signalflow.messages.EventMessage):
+                    start, stop = self._windows[i]
+                    if (i > 0 and message.timestamp_ms < start) or \
+                            (i < len(self._windows) - 1 and
+                             message.timestamp_ms >= stop):
+                        continue
+
+                yield message
@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2018 SignalFx, Inc. All Rights Reserved.
+
+import io
+import os
+import sys
+import time
+
+
+# Size of the output buffer; the buffer is flushed when it fills up.
+_DEFAULT_BUFFER_SIZE = 1 << 20
+
+# Maximum time, in seconds, buffered output can wait before being flushed.
+_DEFAULT_FLUSH_INTERVAL = 1.0
+
+# Amount of text written between two checks of the size of a rotating
+# output.
+_ROTATE_CHECK_SIZE = 1 << 16
+
+# Supported compression formats, and their file extensions.
+_COMPRESSION_EXTENSIONS = {
+    'gzip': '.gz',
+    'zstd': '.zst',
+}
+
+COMPRESSIONS = sorted(_COMPRESSION_EXTENSIONS.keys())
+
+
+def compression_extension(compression):
+    """Return the file extension of the given compression format."""
+    return _COMPRESSION_EXTENSIONS.get(compression, '')
+
+
+def guess_compression(path):
+    """Return the compression format implied by the extension of the given
+    path, if any."""
+    for compression, ext in _COMPRESSION_EXTENSIONS.items():
+        if path and path.endswith(ext):
+            return compression
+    return None
+
+
+def part_path(path, part):
+    """Return the path of the given part of an output split across several
+    files. The first part is written to the path itself; the part number of
+    the others is inserted before the file's extension (and compression
+    extension, if any)."""
+    if not part:
+        return path
+    root, ext = os.path.splitext(path)
+    if guess_compression(path):
+        root, inner = os.path.splitext(root)
+        ext = inner + ext
+    return '{0}.{1}{2}'.format(root, part, ext)
+
+
+def _compressor(raw, compression, level):
+    """Wrap the given binary file object to compress what's written to it."""
+    if compression == 'gzip':
+        import gzip
+        return gzip.GzipFile(fileobj=raw, mode='wb',
+                             compresslevel=9 if level is None else level)
+    if compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError('The zstandard package is required for zstd '
+                             'compression.')
+        return zstandard.ZstdCompressor(
+            level=3 if level is None else level).stream_writer(raw)
+    raise ValueError('Unknown compression {0}!'.format(compression))
+
+
+class Sink(object):
+    """A large buffered text output, optionally compressed.
+
+    Writes accumulate in the underlying file object's buffer, which gets
+    flushed whenever it fills up, or on the first write after the flush
+    interval has elapsed. This keeps streaming output responsive without
+    paying for a flush on every row.
+
+    The writer of the output can give it a header (see set_header()), that
+    starts the output, and is kept up to date as the output evolves.
+
+    A sink writing to a file can also be rotated: once the file grows over
+    rotate_size bytes, or after rotate_interval seconds, output continues
+    in a new file (see part_path()), which starts with the current header.
+    Rotation happens between writes, which the csv module makes one row at
+    a time.
+
+    A sink writing to a file can instead append to it, to continue a
+    previous output."""
+
+    def __init__(self, path=None, flush_interval=_DEFAULT_FLUSH_INTERVAL,
+                 buffer_size=_DEFAULT_BUFFER_SIZE, compression=None,
+                 compression_level=None, rotate_size=None,
+                 rotate_interval=None, append=False):
+        if not path or path == '-':
+            path = None
+            if rotate_size or rotate_interval:
+                raise ValueError('Only file outputs can be rotated.')
+        self._path = path
+        self._flush_interval = flush_interval
+        self._buffer_size = buffer_size
+        self._compression = compression
+        self._compression_level = compression_level
+        self._rotate_size = rotate_size
+        self._rotate_interval = rotate_interval
+        self._header = ''
+        self._append = append
+        self._part = 0
+        self._unchecked = 0
+        self._open()
+        self._last_flush = self._opened
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _open(self):
+        if self._path:
+            mode = 'ab' if self._append and not self._part else 'wb'
+            self._raw = io.open(part_path(self._path, self._part), mode,
+                                buffering=self._buffer_size)
+        else:
+            sys.stdout.flush()
+            self._raw = io.open(sys.stdout.fileno(), 'wb',
+                                buffering=self._buffer_size, closefd=False)
+        stream = self._raw
+        if self._compression:
+            stream = _compressor(self._raw, self._compression,
+                                 self._compression_level)
+        self._fileobj = io.TextIOWrapper(stream, newline='')
+        self._opened = time.time()
+        # Whether anything was written to the current file, and the header
+        # it started with.
+        self._started = bool(self._append and not self._part and
+                             self._raw.tell())
+        self._part_header = None
+
+    def _close(self):
+        self._fileobj.close()
+        # Compressors don't necessarily close the file they write to.
+        self._raw.close()
+
+    def _rotate(self):
+        self._close()
+        self._part += 1
+        self._unchecked = 0
+        self._open()
+        if self._header:
+            self._fileobj.write(self._header)
+            self._started = True
+        self._part_header = self._header
+
+    def _should_rotate(self, now):
+        if self._rotate_interval and now - self._opened >= \
+                self._rotate_interval:
+            return True
+        if self._rotate_size and self._unchecked >= _ROTATE_CHECK_SIZE:
+            self._unchecked = 0
+            return self._raw.tell() >= self._rotate_size
+        return False
+
+    def set_header(self, header):
+        """Set the header of the output, as text. It is written right away
+        if nothing was written yet. When the output is rotated, each new
+        file starts with the current header; if the header changes after
+        the current file started with another one, output continues in a
+        new file right away, so that the header of each file describes all
+        its rows. Output that isn't rotated repeats the new header inline
+        instead, before the rows it describes."""
+        self._header = header
+        if not self._started:
+            self._fileobj.write(header)
+            self._started = True
+            self._part_header = header
+        elif self._part_header is None:
+            # Appending to a previous output, which has its header already.
+            self._part_header = header
+        elif header != self._part_header:
+            if self._rotate_size or self._rotate_interval:
+                self._rotate()
+            else:
+                self._fileobj.write(header)
+                self._part_header = header
+
+    def write(self, s):
+        if self._rotate_size or self._rotate_interval:
+            self._unchecked += len(s)
+            if self._should_rotate(time.time()):
+                self._rotate()
+
+        self._started = True
+        self._fileobj.write(s)
+        if self._flush_interval is not None and \
+                time.time() - self._last_flush >= self._flush_interval:
+            self.flush()
+
+    def flush(self):
+        self._fileobj.flush()
+        self._last_flush = time.time()
+
+    @property
+    def size(self):
+        """The size, in bytes, of the data written to the current output
+        file so far, once flushed."""
+        return self._raw.tell()
+
+    def close(self):
+        self.flush()
+        self._close()
+
+
+def open_sink(path=None, flush_interval=_DEFAULT_FLUSH_INTERVAL,
+              buffer_size=_DEFAULT_BUFFER_SIZE, compression=None,
+              compression_level=None, rotate_size=None, rotate_interval=None,
+              append=False):
+    """Open a buffered output sink.
+
+    :param path: The path of the file to write to, or None (or '-') to write
+        to stdout.
+    :param flush_interval: The maximum time, in seconds, output can stay
+        buffered before being flushed, or None to only flush when the buffer
+        is full.
+    :param buffer_size: The size of the output buffer, in bytes.
+    :param compression: The compression format, one of COMPRESSIONS, or
+        None for uncompressed output.
+    :param compression_level: The compression level, or None for the
+        format's default.
+    :param rotate_size: The size, in bytes, past which output continues in
+        a new file, or None.
+    :param rotate_interval: The time, in seconds, after which output
+        continues in a new file, or None.
+    :param append: Whether to append to the file rather than overwrite it.
+    """
+    return Sink(path, flush_interval=flush_interval, buffer_size=buffer_size,
+                compression=compression, compression_level=compression_level,
+                rotate_size=rotate_size, rotate_interval=rotate_interval,
+                append=append)
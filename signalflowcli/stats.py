@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2018 SignalFx, Inc. All Rights Reserved.
+
+import collections
+import json
+import sys
+import time
+
+from signalfx import signalflow
+
+from . import utils
+
+
+def _message(msg):
+    utils.message(msg, out=sys.stderr)
+
+
+def _percentile(values, p):
+    """Return the pth percentile of the given sorted list of values."""
+    return values[min(len(values) - 1, int(len(values) * p / 100.0))]
+
+
+class StreamStats(object):
+    """Statistics about the message stream of a computation, to tell apart
+    time spent waiting on the backend and the network from time spent
+    processing and rendering the messages.
+
+    The statistics object must be created right before the computation is
+    requested; its stream is then passed through track(). Outputs that
+    render in the background report their rendering time with
+    add_render_time(). For computations read ahead into a queue (see
+    buffered.BufferedFlow), the depth of the queue and the number of data
+    messages dropped or coalesced are also reported."""
+
+    def __init__(self):
+        self._requested = time.time()
+        self._ended = None
+        self._job_start = None
+        self._first_data = None
+        self._tsids = set()
+        # Lag of each data message's logical timestamp behind the wall
+        # clock at the time it was received, in milliseconds.
+        self._lags = []
+        self.counts = collections.Counter()
+        self.wait_time = 0.0
+        self.processing_time = 0.0
+        self.render_time = 0.0
+        self._queue_report = None
+
+    def add_render_time(self, duration):
+        self.render_time += duration
+
+    def _record(self, message, now):
+        self.counts[type(message).__name__] += 1
+        if isinstance(message, signalflow.messages.JobStartMessage):
+            if self._job_start is None:
+                self._job_start = now
+        elif isinstance(message, signalflow.messages.DataMessage):
+            if self._first_data is None:
+                self._first_data = now
+            self._lags.append(now * 1000 - message.logical_timestamp_ms)
+            self._tsids.update(message.data)
+
+    def track(self, messages, computation=None):
+        """Generate the given stream of messages, measuring the time spent
+        waiting for each message, and the time spent by the consumer
+        processing it. The computation the messages come from, if given,
+        may report the statistics of its queue."""
+        self._queue_report = getattr(computation, 'queue_report', None)
+        it = iter(messages)
+        try:
+            while True:
+                waiting = time.time()
+                try:
+                    message = next(it)
+                except StopIteration:
+                    return
+                received = time.time()
+                self.wait_time += received - waiting
+                self._record(message, received)
+                yield message
+                self.processing_time += time.time() - received
+        finally:
+            self._ended = time.time()
+
+    def report(self):
+        """Return the statistics as a dictionary."""
+        ended = self._ended or time.time()
+        duration = ended - self._requested
+        total = sum(self.counts.values())
+        lags = sorted(self._lags)
+
+        def _since_request(t):
+            return round(t - self._requested, 6) if t is not None else None
+
+        return {
+            'duration_seconds': round(duration, 6),
+            'time_to_job_start_seconds': _since_request(self._job_start),
+            'time_to_first_data_seconds': _since_request(self._first_data),
+            'messages': dict(self.counts),
+            'messages_total': total,
+            'messages_per_second':
+                round(total / duration, 2) if duration else None,
+            'lag_ms': {
+                'min': int(lags[0]),
+                'p50': int(_percentile(lags, 50)),
+                'p90': int(_percentile(lags, 90)),
+                'p99': int(_percentile(lags, 99)),
+                'max': int(lags[-1]),
+            } if lags else None,
+            'tsids': len(self._tsids),
+            'wait_seconds': round(self.wait_time, 6),
+            'processing_seconds': round(self.processing_time, 6),
+            'render_seconds': round(self.render_time, 6),
+            'queue': self._queue_report() if self._queue_report else None,
+        }
+
+    def write(self, path=None):
+        """Display a summary of the statistics, and append them as a line
+        of JSON to the given file, if any."""
+        r = self.report()
+
+        def _seconds(v):
+            return '{0:.3f}s'.format(v) if v is not None else '-'
+
+        _message('Stream statistics:\n')
+        _message('  time to job start:  {0}\n'.format(
+            _seconds(r['time_to_job_start_seconds'])))
+        _message('  time to first data: {0}\n'.format(
+            _seconds(r['time_to_first_data_seconds'])))
+        _message('  duration:           {0}\n'.format(
+            _seconds(r['duration_seconds'])))
+        _message('  messages:           {0} ({1}/s){2}\n'.format(
+            r['messages_total'], r['messages_per_second'],
+            ''.join('\n    {0}: {1}'.format(k, v)
+                    for k, v in sorted(r['messages'].items()))))
+        _message('  time series:        {0}\n'.format(r['tsids']))
+        if r['lag_ms']:
+            _message('  lag (ms):           min {min}, p50 {p50}, '
+                     'p90 {p90}, p99 {p99}, max {max}\n'
+                     .format(**r['lag_ms']))
+        _message('  waiting:            {0}\n'.format(
+            _seconds(r['wait_seconds'])))
+        _message('  processing:         {0}\n'.format(
+            _seconds(r['processing_seconds'])))
+        _message('  rendering:          {0}\n'.format(
+            _seconds(r['render_seconds'])))
+        if r['queue']:
+            _message('  queue:              max depth {max_depth}/{size}, '
+                     '{dropped} dropped, {coalesced} coalesced ({policy})\n'
+                     .format(**r['queue']))
+
+        if path:
+            with open(path, 'a') as f:
+                f.write(json.dumps(r, sort_keys=True))
+                f.write('\n')
@@ -64,3 +64,41 @@ def timeseries_repr(obj):
         s = u'{0}: {1}'.format(label, s)
 
     return s
+
+
+class TimeseriesReprCache(object):
+    """A cache of the timeseries representations of a computation, keyed by
+    tsid.
+
+    Metadata for a given tsid never changes, so its representation only
+    needs to be computed once. The cache holds the representation of every
+    live time series of the computation, however many there are, and
+    representations are evicted when their time series expire. Hits and
+    misses are counted in the hits and misses attributes."""
+
+    def __init__(self):
+        self._cache = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._cache)
+
+    def get(self, tsid, metadata):
+        """Return the representation of the timeseries with the given tsid,
+        computing it from the given metadata if it isn't cached yet."""
+        s = self._cache.get(tsid)
+        if s is not None:
+            self.hits += 1
+            return s
+
+        self.misses += 1
+        s = timeseries_repr(metadata)
+        # Don't remember the lack of metadata, it may show up later.
+        if s is not None:
+            self._cache[tsid] = s
+        return s
+
+    def expire(self, tsid):
+        """Evict the representation of the given expired timeseries."""
+        self._cache.pop(tsid, None)
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2018 SignalFx, Inc. All Rights Reserved.
+
+import csv
+import os
+
+import pytest
+
+from signalflowcli import batch, dimensions
+import synthetic
+
+_PARAMS = dict(start=None, stop=None, resolution=None, max_delay=None)
+_GROUPS = ['az:az-{0}'.format(i) for i in range(4)]
+
+
+def _programs(tmpdir, count=2):
+    programs = tmpdir.mkdir('programs')
+    for i in range(count):
+        programs.join('p{0}.flow'.format(i)).write('synthetic')
+    return str(programs)
+
+
+def _view():
+    return dimensions.View(dimensions.parse_filter('az:az-*'),
+                           dimensions.parse_grouping('az'))
+
+
+def test_csv_outputs_apply_the_view(tmpdir):
+    out = str(tmpdir.join('out'))
+    failures = batch.run(synthetic.SyntheticFlow(20, 10), _programs(tmpdir),
+                         out, 'csv', _PARAMS, view=_view())
+    assert not failures
+    for name in ['p0.csv', 'p1.csv']:
+        with open(os.path.join(out, name)) as f:
+            rows = list(csv.reader(f))
+        assert rows[0] == ['timestamp'] + _GROUPS
+        assert len(rows) == 11
+
+
+def test_columnar_outputs_apply_the_view(tmpdir):
+    pq = pytest.importorskip('pyarrow.parquet')
+    out = str(tmpdir.join('out'))
+    failures = batch.run(synthetic.SyntheticFlow(20, 10), _programs(tmpdir),
+                         out, 'parquet', _PARAMS, view=_view())
+    assert not failures
+    for name in ['p0.parquet', 'p1.parquet']:
+        table = pq.read_table(os.path.join(out, name))
+        assert table.column_names[1:] == _GROUPS
+        assert table.num_rows == 10
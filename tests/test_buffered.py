@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2018 SignalFx, Inc. All Rights Reserved.
+
+import pytest
+
+from signalfx import signalflow
+from signalflowcli import buffered, csvflow
+import synthetic
+
+_PARAMS = dict(start=None, stop=None, resolution=None, max_delay=None,
+               quiet=True)
+
+
+class _ReadAheadFlow(object):
+    """A BufferedFlow whose computations let their reader thread read the
+    whole stream before handing the first message to the consumer, like
+    a slow output would."""
+
+    def __init__(self, flow, policy):
+        self._flow = buffered.BufferedFlow(flow, policy=policy)
+
+    def execute(self, program, **kwargs):
+        c = self._flow.execute(program, **kwargs)
+        stream = c.stream
+
+        def read_ahead():
+            messages = stream()
+            first = next(messages)
+            c._thread.join(5)
+            yield first
+            for message in messages:
+                yield message
+        c.stream = read_ahead
+        return c
+
+    def close(self):
+        pass
+
+
+def _flow():
+    return synthetic.SyntheticFlow(10, 80, churn=0.2)
+
+
+@pytest.mark.parametrize('policy', buffered.POLICIES)
+def test_churn_output_matches_unbuffered(policy):
+    for rows in csvflow.rows, csvflow.long_rows:
+        expected = list(rows(_flow(), 'synthetic', **_PARAMS))
+        actual = list(rows(_ReadAheadFlow(_flow(), policy), 'synthetic',
+                           **_PARAMS))
+        assert actual == expected
+    assert len(expected) == 1 + 80 * 10
+
+
+@pytest.mark.parametrize('policy', buffered.POLICIES)
+def test_state_follows_the_consumer(policy):
+    c = _ReadAheadFlow(_flow(), policy).execute('synthetic')
+    for message in c.stream():
+        if isinstance(message, signalflow.messages.DataMessage):
+            assert c.last_logical_ts == message.logical_timestamp_ms
+            assert c.get_known_tsids() == sorted(message.data)
+            for tsid in message.data:
+                assert c.get_metadata(tsid)
+    assert c.resolution == 1000
+    c.close()
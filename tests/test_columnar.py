@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2018 SignalFx, Inc. All Rights Reserved.
+
+import os
+import pytest
+
+from signalflowcli import columnar, sink
+import synthetic
+
+pa = pytest.importorskip('pyarrow')
+
+_PARAMS = dict(start=None, stop=None, resolution=None, max_delay=None)
+
+
+def _read(fmt, path):
+    if fmt == 'parquet':
+        import pyarrow.parquet
+        f = pyarrow.parquet.ParquetFile(path)
+        return f.read(), f.num_row_groups
+    with pa.ipc.open_file(path) as f:
+        return f.read_all(), f.num_record_batches
+
+
+def _parts(fmt, path):
+    parts = []
+    while os.path.exists(sink.part_path(path, len(parts))):
+        parts.append(_read(fmt, sink.part_path(path, len(parts))))
+    return parts
+
+
+def _values(flow):
+    """Return the number of values in the data messages of the given
+    synthetic flow."""
+    return sum(len(m.data) for m in flow.execute('synthetic').stream()
+               if isinstance(m, synthetic.messages.DataMessage))
+
+
+@pytest.mark.parametrize('fmt', columnar.FORMATS)
+def test_row_groups(tmpdir, fmt):
+    path = str(tmpdir.join('out.' + fmt))
+    columnar.write(path, synthetic.SyntheticFlow(20, 30, sparsity=0.5),
+                   'synthetic', quiet=True, fmt=fmt, row_group_size=10,
+                   **_PARAMS)
+    parts = _parts(fmt, path)
+    assert len(parts) == 1
+    table, row_groups = parts[0]
+    assert table.num_rows == 30
+    assert table.num_columns == 21
+    assert row_groups == 3
+
+
+@pytest.mark.parametrize('fmt', columnar.FORMATS)
+def test_churn_keeps_row_groups(tmpdir, fmt):
+    path = str(tmpdir.join('out.' + fmt))
+    flow = synthetic.SyntheticFlow(10, 30, churn=0.2)
+    columnar.write(path, flow, 'synthetic', quiet=True, fmt=fmt,
+                   row_group_size=10, **_PARAMS)
+    parts = _parts(fmt, path)
+    # Each row group brings new time series, and needs a new part file,
+    # but row groups stay whole.
+    assert len(parts) == 3
+    assert [(table.num_rows, row_groups) for table, row_groups in parts] == \
+        [(10, 1)] * 3
+    assert [table.num_columns for table, _ in parts] == [29, 49, 69]
+    assert sum(sum(column.length() - column.null_count
+                   for column in table.columns[1:])
+               for table, _ in parts) == _values(flow)
+
+
+@pytest.mark.parametrize('fmt', columnar.FORMATS)
+def test_rotation_by_size(tmpdir, fmt):
+    path = str(tmpdir.join('out.' + fmt))
+    columnar.write(path, synthetic.SyntheticFlow(20, 35), 'synthetic',
+                   quiet=True, fmt=fmt, row_group_size=10, rotate_size=1,
+                   **_PARAMS)
+    parts = _parts(fmt, path)
+    assert [table.num_rows for table, _ in parts] == [10, 10, 10, 5]
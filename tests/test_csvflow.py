@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2018 SignalFx, Inc. All Rights Reserved.
+
+import pytest
+
+from signalflowcli import csvflow, utils
+import synthetic
+
+_PARAMS = dict(start=None, stop=None, resolution=None, max_delay=None)
+
+
+def _rows(flow, **kwargs):
+    return list(csvflow.rows(flow, 'synthetic', **dict(_PARAMS, **kwargs)))
+
+
+def test_rows_without_churn_are_well_formed():
+    rows = _rows(synthetic.SyntheticFlow(20, 10, sparsity=0.5), quiet=True)
+    assert len(rows) == 11
+    assert rows[0][0] == 'timestamp'
+    assert all(len(row) == len(rows[0]) for row in rows)
+
+
+def test_rows_append_columns_for_new_time_series(capsys):
+    rows = _rows(synthetic.SyntheticFlow(10, 5, churn=0.2))
+    # Each data message brings 2 new time series, in new columns named by
+    # a new header row.
+    assert [len(row) for row in rows] == [11, 11, 13, 13, 15, 15, 17, 17,
+                                          19, 19]
+    for header, row in zip(rows[::2], rows[1::2]):
+        assert header[0] == 'timestamp'
+        assert row[0] != 'timestamp'
+    assert rows[-2][1:11] == rows[0][1:]
+    err = capsys.readouterr().err
+    assert err.count('Schema change: added column') == 8
+    assert 'added column 11 (' in err
+
+
+def test_long_and_frame_outputs_dont_announce_columns(capsys):
+    flow = synthetic.SyntheticFlow(10, 5, churn=0.2)
+    list(csvflow.long_rows(flow, 'synthetic', **_PARAMS))
+    csvflow.frame(flow, 'synthetic', **_PARAMS)
+    assert 'Schema change' not in capsys.readouterr().err
+
+
+def test_window_width_is_bounded_with_churn():
+    numpy = pytest.importorskip('numpy')
+    window = csvflow.Window(20)
+    data = {}
+    widths = set()
+    for schema, message in csvflow.table(
+            synthetic.SyntheticFlow(10, 200, churn=0.2), 'synthetic',
+            quiet=True, expire=True, **_PARAMS):
+        window.append(schema, message)
+        data[message.logical_timestamp_ms] = message.data
+        widths.add(len(schema))
+    assert widths == set([10])
+    assert window._values.shape[1] <= 16
+
+    # Reused columns only hold the values of their current time series.
+    values = window.values(len(schema))
+    for row, ts in zip(values, window.timestamps()):
+        for i, value in enumerate(row):
+            if not numpy.isnan(value):
+                assert data[ts][schema.tsids[i]] == value
+    assert not numpy.isnan(values[-1]).any()
+
+
+def test_table_keeps_columns_without_expire():
+    widths = [len(schema) for schema, _ in csvflow.table(
+        synthetic.SyntheticFlow(10, 5, churn=0.2), 'synthetic', quiet=True,
+        **_PARAMS)]
+    assert widths == [10, 12, 14, 16, 18]
+
+
+def test_reused_columns_are_named_after_their_time_series():
+    for schema, message in csvflow.table(
+            synthetic.SyntheticFlow(10, 20, churn=0.2), 'synthetic',
+            quiet=True, expire=True, **_PARAMS):
+        for i, tsid in enumerate(schema.tsids):
+            assert schema.names[i] == utils.timeseries_repr(
+                schema.metadata(i))
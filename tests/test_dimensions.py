@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2018 SignalFx, Inc. All Rights Reserved.
+
+import pytest
+
+from signalflowcli import csvflow, dimensions
+import synthetic
+
+_PARAMS = dict(start=None, stop=None, resolution=None, max_delay=None,
+               quiet=True)
+
+
+def test_index_remove():
+    index = dimensions.DimensionIndex()
+    index.add('a', {'host': 'web-1', 'az': 'x', 'sf_type': 'ignored'})
+    index.add('b', {'host': 'web-2', 'az': 'x'})
+    index.remove('a')
+    index.remove('c')
+    assert 'a' not in index
+    assert len(index) == 1
+    assert index.find('host', 'web-*') == set(['b'])
+    assert index.find('az', 'x') == set(['b'])
+    index.remove('b')
+    assert not len(index)
+    assert index.find('az', '*') == set()
+
+
+def test_csv_view_forgets_expired_time_series():
+    view = dimensions.View(dimensions.parse_filter('az:az-*'),
+                           dimensions.parse_grouping('az'))
+    rows = list(csvflow.rows(synthetic.SyntheticFlow(10, 50, churn=0.2),
+                             'synthetic', view=view, **_PARAMS))
+    assert rows[0] == ['timestamp'] + ['az:az-{0}'.format(i)
+                                       for i in range(4)]
+    assert len(view.index) == 10
+
+
+def test_live_view_forgets_expired_time_series():
+    live = pytest.importorskip('signalflowcli.live')
+    view = dimensions.View(dimensions.parse_filter('az:az-1'))
+    c = synthetic.SyntheticFlow(10, 50, churn=0.2).execute('synthetic')
+    display = live.LiveOutputDisplay(c, None, view=view)
+    for message in c.stream():
+        display.update(message)
+    assert len(view.index) == 10
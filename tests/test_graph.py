@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2018 SignalFx, Inc. All Rights Reserved.
+
+import pytest
+
+pytest.importorskip('pandas')
+
+from signalflowcli import graph  # noqa: E402
+
+_CSV = 'timestamp,a\n1000,1\n2000,2\n'
+
+
+class _File(object):
+    """A file-like object with no seekable() method, like Python 2 files
+    and StringIO."""
+
+    def __init__(self, data):
+        self._data = data
+
+    def read(self, *args):
+        data, self._data = self._data, ''
+        return data
+
+
+@pytest.mark.parametrize('data', [_CSV, _CSV.splitlines(), _File(_CSV)])
+def test_read_csv(data):
+    df = graph._read_csv(data)
+    assert list(df.columns) == ['a']
+    assert list(df['a']) == [1, 2]
+
+
+def test_read_csv_with_repeated_header():
+    df = graph._read_csv(['"timestamp","a"', '1000,1',
+                          '"timestamp","a","b"', '2000,2,3', '3000,,4'])
+    assert list(df.columns) == ['a', 'b']
+    assert list(df['b'].fillna(0)) == [0, 3, 4]
+
+
+def test_read_csv_with_unnamed_columns():
+    df = graph._read_csv(['timestamp,a', '1000,1', '2000,2,3'])
+    assert list(df.columns) == ['a', 'column 2']
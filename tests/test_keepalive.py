@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2018 SignalFx, Inc. All Rights Reserved.
+
+import threading
+import time
+
+from signalflowcli import keepalive
+import synthetic
+
+
+class _HangingComputation(object):
+    """A computation whose stream never starts, until it is closed."""
+
+    def __init__(self):
+        self._closed = threading.Event()
+
+    def stream(self):
+        self._closed.wait()
+        return iter([])
+
+    def close(self):
+        self._closed.set()
+
+
+class _Flow(object):
+    """A flow recording the programs it executes, whose first executions
+    fail as if the connection was down, and whose warm-up computations
+    optionally never start."""
+
+    def __init__(self, failures=0, hang=False):
+        self.failures = failures
+        self.hang = hang
+        self.executed = []
+        self.closed = []
+
+    def execute(self, program, **kwargs):
+        self.executed.append(program)
+        if self.failures:
+            self.failures -= 1
+            raise IOError('connection refused')
+        if self.hang and program == keepalive._WARMUP_PROGRAM:
+            c = _HangingComputation()
+        else:
+            c = synthetic.SyntheticComputation(
+                synthetic.generate(1, 1), 1000)
+        close = c.close
+        c.close = lambda: (self.closed.append(program), close())
+        return c
+
+    def close(self):
+        pass
+
+
+def _wait(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def _warmups(flow):
+    return flow.closed.count(keepalive._WARMUP_PROGRAM)
+
+
+def test_warms_up_at_start_and_after_each_computation():
+    flow = _Flow()
+    kf = keepalive.KeepAliveFlow(flow, interval=600)
+    try:
+        assert _wait(lambda: _warmups(flow) == 1)
+        kf.execute('program').close()
+        assert _wait(lambda: _warmups(flow) == 2)
+        time.sleep(0.1)
+        assert _warmups(flow) == 2
+    finally:
+        kf.close()
+
+
+def test_retries_at_the_interval():
+    flow = _Flow(failures=2)
+    kf = keepalive.KeepAliveFlow(flow, interval=0.01)
+    try:
+        assert _wait(lambda: _warmups(flow) >= 1)
+        assert set(flow.executed) == set([keepalive._WARMUP_PROGRAM])
+    finally:
+        kf.close()
+
+
+def test_no_warm_up_while_a_computation_runs():
+    flow = _Flow()
+    kf = keepalive.KeepAliveFlow(flow, interval=0.01)
+    try:
+        assert _wait(lambda: flow.closed)
+        c = kf.execute('program')
+        warmups = len(flow.executed)
+        time.sleep(0.1)
+        assert flow.executed[warmups - 1:] == ['program']
+        c.close()
+        assert _wait(lambda: len(flow.executed) > warmups)
+    finally:
+        kf.close()
+
+
+def test_warm_up_doesnt_hold_back_execute_or_close(monkeypatch):
+    monkeypatch.setattr(keepalive, '_WARMUP_TIMEOUT', 0.2)
+    flow = _Flow(hang=True)
+    kf = keepalive.KeepAliveFlow(flow, interval=600)
+    assert _wait(lambda: flow.executed)
+    started = time.time()
+    kf.execute('program').close()
+    kf.close()
+    assert time.time() - started < 0.1
+    # The warm-up gives up at its timeout.
+    assert _wait(lambda: keepalive._WARMUP_PROGRAM in flow.closed, 1)
+
+
+def test_disabled():
+    flow = _Flow()
+    kf = keepalive.KeepAliveFlow(flow, interval=0)
+    kf.execute('program').close()
+    time.sleep(0.05)
+    assert flow.executed == ['program']
+    kf.close()
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2018 SignalFx, Inc. All Rights Reserved.
+
+import random
+import socket
+
+import pytest
+
+from signalfx.signalflow import errors, messages
+from signalflowcli import buffered, csvflow, resume, sink
+import synthetic
+
+_START = 1600000000000
+_RESOLUTION = 1000
+_PARAMS = dict(start=_START, stop=_START + 100 * _RESOLUTION,
+               resolution=_RESOLUTION, max_delay=None)
+
+# The time series of the computation, with the range of timestamps over
+# which they report: some appear or expire mid-stream.
+_LIFETIMES = {
+    'A': (0, 100),
+    'B': (0, 40),
+    'C': (20, 70),
+    'D': (50, 100),
+    'E': (60, 100),
+}
+
+
+class _RangeFlow(object):
+    """A flow whose computations output the same values for a given
+    timestamp whatever their time range, so that a resumed computation
+    continues exactly where the interrupted one stopped."""
+
+    def execute(self, program, start=None, stop=None, resolution=None,
+                **kwargs):
+        result = [messages.JobStartMessage(0, 'handle')]
+        live = set()
+        for ts in range(start - start % resolution, stop, resolution):
+            n = (ts - _START) // resolution
+            for tsid, (born, died) in sorted(_LIFETIMES.items()):
+                if n == died and tsid in live:
+                    live.remove(tsid)
+                    result.append(messages.ExpiredTsIdMessage(tsid))
+                elif born <= n < died and tsid not in live:
+                    live.add(tsid)
+                    result.append(messages.MetadataMessage(tsid, {
+                        'sf_type': 'MetricTimeSeries',
+                        'sf_metric': 'metric',
+                        'sf_key': ['sf_metric', 'host'],
+                        'host': tsid.lower(),
+                    }))
+            rnd = random.Random(ts)
+            data = dict((tsid, rnd.randint(0, 100)) for tsid in sorted(live)
+                        if rnd.random() < 0.8)
+            message = messages.DataMessage(ts, [])
+            message.add_data(data)
+            result.append(message)
+        return synthetic.SyntheticComputation(result, resolution)
+
+    def close(self):
+        pass
+
+
+class _FailingFlow(object):
+    """Wraps a flow so that the stream of its first computations fails
+    with the given error after some data messages."""
+
+    def __init__(self, flow, error, failures, after=30):
+        self._flow = flow
+        self._error = error
+        self._failures = failures
+        self._after = after
+        self.starts = []
+
+    def execute(self, program, **kwargs):
+        self.starts.append(kwargs['start'])
+        c = self._flow.execute(program, **kwargs)
+        if self._failures:
+            self._failures -= 1
+            c.stream = self._failing(c.stream)
+        return c
+
+    def _failing(self, stream):
+        def failing():
+            data = 0
+            for message in stream():
+                if isinstance(message, messages.DataMessage):
+                    data += 1
+                    if data > self._after:
+                        raise self._error
+                yield message
+        return failing
+
+    def close(self):
+        pass
+
+
+def _export(path, flow, layout, digest='digest', retries=5):
+    """Export the output of the computation to the given path, resuming it
+    from its checkpoint, the way the csv output does with --resume."""
+    params = dict(_PARAMS)
+    checkpoint = resume.open_checkpoint(path, digest, params)
+    if checkpoint.complete:
+        return checkpoint
+    flow = resume.ResumableFlow(flow, checkpoint.timestamp, retries)
+    with sink.open_sink(path, append=checkpoint.timestamp is not None) \
+            as out:
+        checkpoint.out = out
+        csvflow.write(out, flow, 'program', quiet=True, layout=layout,
+                      checkpoint=checkpoint, **params)
+    return checkpoint
+
+
+def _read(path):
+    with open(path) as f:
+        return f.read()
+
+
+@pytest.fixture(autouse=True)
+def _no_backoff(monkeypatch):
+    monkeypatch.setattr(resume, '_BACKOFF', 0)
+
+
+@pytest.fixture
+def expected(tmpdir):
+    def _expected(layout):
+        path = str(tmpdir.join('expected.csv'))
+        with sink.open_sink(path) as out:
+            csvflow.write(out, _RangeFlow(), 'program', quiet=True,
+                          layout=layout, **_PARAMS)
+        return _read(path)
+    return _expected
+
+
+@pytest.mark.parametrize('layout', csvflow.LAYOUTS)
+@pytest.mark.parametrize('error', [
+    errors.ComputationFailed(['failed']),
+    socket.error('connection reset'),
+])
+def test_retried_export_is_identical(tmpdir, expected, layout, error):
+    path = str(tmpdir.join('out.csv'))
+    flow = _FailingFlow(_RangeFlow(), error, 3)
+    checkpoint = _export(path, flow, layout)
+    assert _read(path) == expected(layout)
+    assert checkpoint.complete
+    assert resume.Checkpoint.load(resume.sidecar_path(path)).complete
+    # Each retry starts right after the last data message output.
+    assert flow.starts == [_START] + [_START + n * _RESOLUTION + 1
+                                      for n in [29, 58, 87]]
+
+
+@pytest.mark.parametrize('layout', csvflow.LAYOUTS)
+def test_buffered_retried_export_is_identical(tmpdir, expected, layout):
+    path = str(tmpdir.join('out.csv'))
+    flow = buffered.BufferedFlow(_FailingFlow(
+        _RangeFlow(), errors.ComputationFailed(['failed']), 3))
+    _export(path, flow, layout)
+    assert _read(path) == expected(layout)
+
+
+@pytest.mark.parametrize('layout', csvflow.LAYOUTS)
+def test_interrupted_export_resumes(tmpdir, expected, layout):
+    path = str(tmpdir.join('out.csv'))
+    _export(path, _FailingFlow(_RangeFlow(), KeyboardInterrupt(), 1, 45),
+            layout)
+    checkpoint = resume.Checkpoint.load(resume.sidecar_path(path))
+    assert not checkpoint.complete
+    assert checkpoint.timestamp == _START + 44 * _RESOLUTION
+    # Rows written after the last checkpoint, before being killed.
+    with open(path, 'a') as f:
+        f.write('1600000999000,garbage\n16000')
+
+    checkpoint = _export(path, _RangeFlow(), layout)
+    assert _read(path) == expected(layout)
+    assert checkpoint.complete
+
+
+def test_failing_export_resumes(tmpdir, expected):
+    path = str(tmpdir.join('out.csv'))
+    # Only retries in a row that make no progress count towards the limit.
+    flow = _FailingFlow(_RangeFlow(), errors.ComputationFailed(['failed']),
+                        10, 0)
+    with pytest.raises(errors.ComputationFailed):
+        _export(path, flow, 'wide', retries=2)
+    assert len(flow.starts) == 3
+    _export(path, _RangeFlow(), 'wide')
+    assert _read(path) == expected('wide')
+
+
+def test_non_transient_errors_are_not_retried(tmpdir):
+    flow = _FailingFlow(_RangeFlow(),
+                        errors.SignalFlowException(401, 'unauthorized'), 1)
+    with pytest.raises(errors.SignalFlowException):
+        _export(str(tmpdir.join('out.csv')), flow, 'wide')
+    assert len(flow.starts) == 1
+
+
+def test_complete_export_is_left_untouched(tmpdir, expected):
+    path = str(tmpdir.join('out.csv'))
+    _export(path, _RangeFlow(), 'wide')
+    flow = _FailingFlow(_RangeFlow(), errors.ComputationFailed(['failed']),
+                        1)
+    checkpoint = _export(path, flow, 'wide')
+    assert checkpoint.complete
+    assert not flow.starts
+    assert _read(path) == expected('wide')
+
+
+def test_checkpoint_of_another_export_is_rejected(tmpdir):
+    path = str(tmpdir.join('out.csv'))
+    _export(path, _FailingFlow(_RangeFlow(), KeyboardInterrupt(), 1), 'wide')
+    with pytest.raises(ValueError) as e:
+        _export(path, _RangeFlow(), 'wide', digest='another')
+    assert 'checkpoint of another program' in str(e.value)
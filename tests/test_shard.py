@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2018 SignalFx, Inc. All Rights Reserved.
+
+import time
+
+from signalflowcli import shard
+import synthetic
+
+_START = 1500000000000
+_RESOLUTION = 1000
+
+
+class _RangeFlow(object):
+    """A flow whose computations output one data message per resolution
+    over their [start, stop) time range, counting the messages read."""
+
+    def __init__(self, tsids):
+        self._tsids = tsids
+        self.read = []
+
+    def execute(self, program, start=None, stop=None, resolution=None,
+                **kwargs):
+        messages = synthetic.generate(
+            self._tsids, (stop - start) // resolution, start=start,
+            resolution=resolution)
+        read = [0]
+        self.read.append(read)
+
+        class _Computation(synthetic.SyntheticComputation):
+            def stream(self):
+                for message in super(_Computation, self).stream():
+                    read[0] += 1
+                    yield message
+
+        return _Computation(messages, resolution)
+
+    def close(self):
+        pass
+
+
+def _data(computation):
+    return [(m.logical_timestamp_ms, sorted(m.data.items()))
+            for m in computation.stream()
+            if isinstance(m, synthetic.messages.DataMessage)]
+
+
+def _execute(flow, shards, queue_size):
+    return shard.ShardedFlow(flow, shards, queue_size).execute(
+        'synthetic', start=_START, stop=_START + 100 * _RESOLUTION,
+        resolution=_RESOLUTION)
+
+
+def test_sharded_output_is_identical():
+    flow = _RangeFlow(5)
+    c = _execute(flow, 4, 2)
+    data = _data(c)
+    assert [ts for ts, _ in data] == \
+        [_START + i * _RESOLUTION for i in range(100)]
+    assert [values for _, values in data[:25]] == \
+        [values for _, values in _data(flow.execute(
+            'synthetic', start=_START, stop=_START + 25 * _RESOLUTION,
+            resolution=_RESOLUTION))]
+
+
+def test_shards_read_ahead_is_bounded():
+    flow = _RangeFlow(5)
+    c = _execute(flow, 4, 3)
+    stream = c.stream()
+    next(stream)
+    time.sleep(0.5)
+    # Each shard waits once it has read as many messages as its queue
+    # holds, plus the one waiting to be queued.
+    assert all(read[0] <= 4 for read in flow.read[1:])
+    c.close()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2018 SignalFx, Inc. All Rights Reserved.
+
+import csv
+import gzip
+import io
+import os
+
+from signalflowcli import csvflow, events, sink
+import synthetic
+
+_PARAMS = dict(start=None, stop=None, resolution=None, max_delay=None)
+
+
+def _parts(path):
+    """Return the rows of each part of the rotated output at path."""
+    parts = []
+    while True:
+        part = sink.part_path(path, len(parts))
+        if not os.path.exists(part):
+            return parts
+        if part.endswith('.gz'):
+            f = io.TextIOWrapper(gzip.open(part), newline='')
+        else:
+            f = io.open(part, newline='')
+        with f:
+            parts.append(list(csv.reader(f)))
+
+
+def _write(path, flow, **kwargs):
+    with sink.open_sink(path, compression=sink.guess_compression(path),
+                        **kwargs) as out:
+        csvflow.write(out, flow, 'synthetic', quiet=True, **_PARAMS)
+
+
+def _check_rotation_with_churn(path):
+    _write(path, synthetic.SyntheticFlow(50, 30, churn=0.1),
+           rotate_size=1 << 20)
+    parts = _parts(path)
+    assert len(parts) == 30
+    for rows in parts:
+        assert rows[0][0] == 'timestamp'
+        assert all(len(row) == len(rows[0]) for row in rows[1:])
+    assert sum(len(rows) - 1 for rows in parts) == 30
+
+
+def test_rotation_with_churn(tmpdir):
+    _check_rotation_with_churn(str(tmpdir.join('out.csv')))
+
+
+def test_compressed_rotation_with_churn(tmpdir):
+    _check_rotation_with_churn(str(tmpdir.join('out.csv.gz')))
+
+
+def test_rotation_by_size_repeats_header(tmpdir):
+    path = str(tmpdir.join('out.csv'))
+    _write(path, synthetic.SyntheticFlow(100, 500), rotate_size=100000)
+    parts = _parts(path)
+    assert len(parts) > 2
+    header = parts[0][0]
+    assert len(header) == 101
+    for rows in parts:
+        assert rows[0] == header
+        assert all(len(row) == len(header) for row in rows[1:])
+    assert sum(len(rows) - 1 for rows in parts) == 500
+
+
+def test_rotation_by_size_repeats_events_header(tmpdir):
+    path = str(tmpdir.join('events.csv'))
+    with sink.open_sink(path, rotate_size=1) as out:
+        events.write(out, synthetic.SyntheticFlow(1, 2000, events=2000),
+                     'synthetic', quiet=True, fmt='csv', **_PARAMS)
+    parts = _parts(path)
+    assert len(parts) > 1
+    for rows in parts:
+        assert rows[0] == events._CSV_HEADER
+    assert sum(len(rows) - 1 for rows in parts) == 2000
+
+
+def test_append_doesnt_repeat_header(tmpdir):
+    path = str(tmpdir.join('out.csv'))
+    flow = synthetic.SyntheticFlow(10, 5)
+    _write(path, flow)
+    _write(path, flow, append=True)
+    rows = _parts(path)[0]
+    assert len(rows) == 11
+    assert [row[0] for row in rows].count('timestamp') == 1
+
+
+def test_unrotated_output_repeats_header_with_churn(tmpdir):
+    path = str(tmpdir.join('out.csv'))
+    _write(path, synthetic.SyntheticFlow(10, 5, churn=0.2))
+    rows = _parts(path)[0]
+    assert [row[0] == 'timestamp' for row in rows] == [True, False] * 5
+    for header, row in zip(rows[::2], rows[1::2]):
+        assert len(header) == len(row)
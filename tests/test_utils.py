@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2018 SignalFx, Inc. All Rights Reserved.
+
+from signalflowcli import utils
+
+
+def _metadata(i):
+    return {
+        'sf_type': 'MetricTimeSeries',
+        'sf_metric': 'metric',
+        'sf_key': ['sf_metric', 'host'],
+        'host': 'host-{0}'.format(i),
+    }
+
+
+def test_repr_cache_cyclic_scan():
+    cache = utils.TimeseriesReprCache()
+    for _ in range(3):
+        for i in range(20000):
+            assert cache.get(i, _metadata(i)) == \
+                'metric/host-{0}'.format(i)
+    assert cache.misses == 20000
+    assert cache.hits == 40000
+
+
+def test_repr_cache_expire():
+    cache = utils.TimeseriesReprCache()
+    assert cache.get('a', None) is None
+    assert not len(cache)
+    cache.get('a', _metadata(1))
+    cache.get('b', _metadata(2))
+    cache.expire('a')
+    cache.expire('c')
+    assert len(cache) == 1
+    assert cache.get('b', None) == 'metric/host-2'
+    assert (cache.hits, cache.misses) == (1, 3)
+    # Expired representations are computed again.
+    assert cache.get('a', _metadata(1)) == 'metric/host-1'
+    assert (cache.hits, cache.misses) == (1, 4)
+